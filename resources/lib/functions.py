@@ -4,11 +4,16 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import logging
+import os
+import time
 
 from resources.lib import kodilogging, kodiutils
+from resources.lib.modules import sources
 from resources.lib.modules.addon import Addon
 from resources.lib.modules.contextmenu import ContextMenu
+from resources.lib.modules.guidestore import GUIDE_STORE, GuideStore
 from resources.lib.modules.iptvsimple import IptvSimple
+from resources.lib.modules.receiver import Receiver
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -28,7 +33,9 @@ def setup_iptv_simple():
 
 def refresh():
     """Refresh the channels and EPG"""
-    Addon.refresh(True)
+    Addon.refresh(True, force=True)
+    Receiver.shutdown()
+    sources.close()
 
     # Open settings again
     kodiutils.open_settings()
@@ -50,21 +57,75 @@ def open_settings():
     kodiutils.open_settings()
 
 
+def now_next(channel_id):
+    """Look up what's on now and next on a channel in the EPG we wrote last. Skins can use the IPTVManager.Now.Title,
+    IPTVManager.Now.Start, IPTVManager.Now.Stop and IPTVManager.Next.* properties of the Home window. Scripts can read
+    the query.now_next.json file in our cache."""
+    with GuideStore(os.path.join(kodiutils.get_cache_path(), GUIDE_STORE)) as store:
+        now_and_next = store.get_now_next(channel_id, time.time())
+
+    result = dict(channel=channel_id)
+    kodiutils.set_property('IPTVManager.NowNext.Channel', channel_id)
+    for name, programme in zip(('now', 'next'), now_and_next):
+        result[name] = _programme(programme)
+        kodiutils.set_property('IPTVManager.%s.Title' % name.capitalize(), (programme[2] or '') if programme else '')
+        for index, field in ((0, 'Start'), (1, 'Stop')):
+            kodiutils.set_property('IPTVManager.%s.%s' % (name.capitalize(), field),
+                                   time.strftime('%H:%M', time.localtime(programme[index])) if programme else '')
+    kodiutils.update_cache(('query', 'now_next'), result)
+
+
+def programmes(channel_id, since=None, until=None):
+    """Look up the programmes of a channel between the epoch since and until in the EPG we wrote last. We look from now
+    until a day later by default. Scripts can read the result in the query.programmes.json file in our cache."""
+    since = _epoch('since', since) if since else int(time.time())
+    until = _epoch('until', until) if until else since + 86400
+    with GuideStore(os.path.join(kodiutils.get_cache_path(), GUIDE_STORE)) as store:
+        result = [_programme(programme) for programme in store.get_schedule(channel_id, since, until)]
+    kodiutils.update_cache(('query', 'programmes'), dict(channel=channel_id, since=since, until=until, programmes=result))
+
+
+def _epoch(name, value):
+    """Return the epoch timestamp of an argument, or raise a ValueError that tells what's wrong with it"""
+    try:
+        return int(float(value))
+    except (ValueError, OverflowError):
+        raise ValueError('The %s argument must be an epoch timestamp, not %s' % (name, value))
+
+
+def _programme(programme):
+    """Return a (start, stop, title) tuple of the schedule as a dict, or None"""
+    if programme is None:
+        return None
+    return dict(start=int(programme[0]), stop=int(programme[1]), title=programme[2])
+
+
 def run(args):
     """Run the function"""
+    # Kodi can run scripts in an interpreter it used before, and the settings or add-ons may have changed since
+    kodiutils.invalidate_settings()
+    kodiutils.invalidate_addon_info()
     kodilogging.config()
 
-    function = args[1]
+    # The function, and the minimum and maximum number of arguments it takes
     function_map = {
-        'setup-iptv-simple': setup_iptv_simple,
-        'refresh': refresh,
-        'play_from_contextmenu': play_from_contextmenu,
-        'open_settings': open_settings,
+        'setup-iptv-simple': (setup_iptv_simple, 0, 0),
+        'refresh': (refresh, 0, 0),
+        'play_from_contextmenu': (play_from_contextmenu, 0, 0),
+        'open_settings': (open_settings, 0, 0),
+        'now_next': (now_next, 1, 1),
+        'programmes': (programmes, 1, 3),
     }
-    try:
-        # TODO: allow to pass *args to the function so we can also pass arguments
-        _LOGGER.debug('Routing to function: %s', function)
-        function_map.get(function)()
-    except (TypeError, IndexError):
+    function = args[1] if len(args) > 1 else None
+    if function not in function_map:
+        _LOGGER.error('Could not route to %s', function)
+        raise ValueError('Unknown function %s' % function)
+
+    func, minimum, maximum = function_map[function]
+    params = args[2:]
+    if not minimum <= len(params) <= maximum:
         _LOGGER.error('Could not route to %s', function)
-        raise
+        raise ValueError('The function %s takes %d to %d arguments, not %d' % (function, minimum, maximum, len(params)))
+
+    _LOGGER.debug('Routing to function: %s', function)
+    func(*params)
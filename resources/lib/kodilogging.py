@@ -6,19 +6,16 @@ from __future__ import absolute_import, division, unicode_literals
 import logging
 
 import xbmc
-import xbmcaddon
 
 from resources.lib import kodiutils
 
-ADDON = xbmcaddon.Addon()
-
 
 class KodiLogHandler(logging.StreamHandler):
     """ A log handler for Kodi """
 
     def __init__(self):
         logging.StreamHandler.__init__(self)
-        formatter = logging.Formatter("[{}] [%(name)s] %(message)s".format(ADDON.getAddonInfo("id")))
+        formatter = logging.Formatter("[{}] [%(name)s] %(message)s".format(kodiutils.addon_id()))
         self.setFormatter(formatter)
         # xbmc.LOGNOTICE is deprecated in Kodi 19 Matrix
         if kodiutils.kodi_version_major() > 18:
@@ -39,7 +36,7 @@ class KodiLogHandler(logging.StreamHandler):
 
         # Map DEBUG level to info_level if debug logging setting has been activated
         # This is for troubleshooting only
-        if ADDON.getSetting('debug_logging') == 'true':
+        if kodiutils.get_setting_bool('debug_logging'):
             levels[logging.DEBUG] = self.info_level
 
         try:
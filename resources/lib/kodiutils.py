@@ -4,6 +4,7 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import logging
+import os
 
 import xbmc
 import xbmcaddon
@@ -14,6 +15,14 @@ ADDON = xbmcaddon.Addon()
 
 _LOGGER = logging.getLogger(__name__)
 
+# What we looked up about add-ons, keyed by add-on id, and None for ourselves. It doesn't change while we run, unless
+# add-ons are installed or updated, so we look it up once until invalidate_addon_info is called.
+_ADDON_INFO = {}
+
+# The settings we read, as Kodi stores them. We update them when we write a setting, and forget them when Kodi tells us
+# the settings have changed, see invalidate_settings.
+_SETTINGS = {}
+
 
 class SafeDict(dict):
     """A safe dictionary implementation that does not break down on missing keys"""
@@ -59,13 +68,18 @@ def addon_path(addon=None):
 
 
 def addon_profile(addon=None):
-    """Return add-on profile"""
-    if not addon:
-        addon = ADDON
+    """Cache and return add-on profile"""
+    if hasattr(addon, 'getAddonInfo'):
+        return translate_path(addon.getAddonInfo('profile'))
+    return _get_cached_info(addon, 'translated_profile', lambda: translate_path(get_addon_info('profile', addon)))
+
+
+def translate_path(path):
+    """Return the filesystem path of a special:// path"""
     try:  # Kodi 19
-        return to_unicode(xbmcvfs.translatePath(addon.getAddonInfo('profile')))
+        return to_unicode(xbmcvfs.translatePath(path))
     except AttributeError:  # Kodi 18
-        return to_unicode(xbmc.translatePath(addon.getAddonInfo('profile')))
+        return to_unicode(xbmc.translatePath(path))
 
 
 def ok_dialog(heading='', message=''):
@@ -96,7 +110,7 @@ class progress(xbmcgui.DialogProgress, object):  # pylint: disable=invalid-name,
         """Initialize and create a progress dialog"""
         super(progress, self).__init__()
         if not heading:
-            heading = ADDON.getAddonInfo('name')
+            heading = addon_name()
         self.create(heading, message=message)
 
     def create(self, heading, message=''):  # pylint: disable=arguments-differ
@@ -129,9 +143,12 @@ def localize(string_id, **kwargs):
 def get_setting(key, default=None):
     """Get an add-on setting as string"""
     try:
-        value = to_unicode(ADDON.getSetting(key))
-    except RuntimeError:  # Occurs when the add-on is disabled
-        return default
+        value = _SETTINGS[key]
+    except KeyError:
+        try:
+            value = _SETTINGS[key] = to_unicode(ADDON.getSetting(key))
+        except RuntimeError:  # Occurs when the add-on is disabled
+            return default
     if value == '' and default is not None:
         return default
     return value
@@ -139,15 +156,11 @@ def get_setting(key, default=None):
 
 def get_setting_bool(key, default=None):
     """Get an add-on setting as boolean"""
-    try:
-        return ADDON.getSettingBool(key)
-    except (AttributeError, TypeError):  # On Krypton or older, or when not a boolean
-        value = get_setting(key, default)
-        if value not in ('false', 'true'):
-            return default
-        return bool(value == 'true')
-    except RuntimeError:  # Occurs when the add-on is disabled
+    # Kodi stores a boolean as 'true' or 'false', so we can use the setting we have read
+    value = get_setting(key, default)
+    if value not in ('false', 'true'):
         return default
+    return bool(value == 'true')
 
 
 def get_setting_int(key, default=None):
@@ -164,26 +177,23 @@ def get_setting_int(key, default=None):
 def get_setting_float(key, default=None):
     """Get an add-on setting"""
     try:
-        return ADDON.getSettingNumber(key)
-    except (AttributeError, TypeError):  # On Krypton or older, or when not a float
-        value = get_setting(key, default)
-        try:
-            return float(value)
-        except ValueError:
-            return default
-    except RuntimeError:  # Occurs when the add-on is disabled
+        return float(get_setting(key, default))
+    except (TypeError, ValueError):  # Occurs when not a float
         return default
 
 
 def set_setting(key, value):
     """Set an add-on setting"""
-    return ADDON.setSetting(key, from_unicode(str(value)))
+    ADDON.setSetting(key, from_unicode(str(value)))
+    _SETTINGS[key] = to_unicode(str(value))
 
 
 def set_setting_bool(key, value):
     """Set an add-on setting as boolean"""
     try:
-        return ADDON.setSettingBool(key, value)
+        result = ADDON.setSettingBool(key, value)
+        _SETTINGS[key] = 'true' if value else 'false'
+        return result
     except (AttributeError, TypeError):  # On Krypton or older, or when not a boolean
         if value in ['false', 'true']:
             return set_setting(key, value)
@@ -195,7 +205,9 @@ def set_setting_bool(key, value):
 def set_setting_int(key, value):
     """Set an add-on setting as integer"""
     try:
-        return ADDON.setSettingInt(key, value)
+        result = ADDON.setSettingInt(key, value)
+        _SETTINGS[key] = to_unicode(str(value))
+        return result
     except (AttributeError, TypeError):  # On Krypton or older, or when not an integer
         return set_setting(key, value)
 
@@ -203,11 +215,19 @@ def set_setting_int(key, value):
 def set_setting_float(key, value):
     """Set an add-on setting"""
     try:
-        return ADDON.setSettingNumber(key, value)
+        result = ADDON.setSettingNumber(key, value)
+        # We don't know how Kodi formats the number, so we read it again
+        _SETTINGS.pop(key, None)
+        return result
     except (AttributeError, TypeError):  # On Krypton or older, or when not a float
         return set_setting(key, value)
 
 
+def invalidate_settings():
+    """Forget the settings we read, so we read them again"""
+    _SETTINGS.clear()
+
+
 def open_settings():
     """Open the add-in settings window, shows Credentials"""
     ADDON.openSettings()
@@ -224,14 +244,21 @@ def set_global_setting(key, value):
     return jsonrpc(method='Settings.SetSettingValue', params=dict(setting=key, value=value))
 
 
+def set_property(key, value, window_id=10000):
+    """Set a property of a window, the Home window by default"""
+    xbmcgui.Window(window_id).setProperty(key, value)  # pylint: disable=no-member
+
+
 def get_cond_visibility(condition):
     """Test a condition in XBMC"""
     return xbmc.getCondVisibility(condition)
 
 
 def kodi_version():
-    """Returns full Kodi version as string"""
-    return xbmc.getInfoLabel('System.BuildVersion').split(' ')[0]
+    """Cache and return full Kodi version as string"""
+    if not hasattr(kodi_version, 'cached'):
+        kodi_version.cached = xbmc.getInfoLabel('System.BuildVersion').split(' ')[0]
+    return getattr(kodi_version, 'cached')
 
 
 def kodi_version_major():
@@ -249,15 +276,63 @@ def get_tokens_path():
 def get_cache_path():
     """Cache and return the userdata cache path"""
     if not hasattr(get_cache_path, 'cached'):
-        get_cache_path.cached = addon_profile() + 'cache/'
+        path = os.path.join(addon_profile(), 'cache', '')
+        if not os.path.exists(path):
+            os.makedirs(path)
+        get_cache_path.cached = path
     return getattr(get_cache_path, 'cached')
 
 
+def get_addon_settings_path(name):
+    """Return the path of the settings file of the specified Addon"""
+    return os.path.join(os.path.dirname(os.path.normpath(addon_profile())), name, 'settings.xml')
+
+
+def get_cache(key, default=None):
+    """Get an item from the cache"""
+    import json
+    path = os.path.join(get_cache_path(), '.'.join(key) + '.json')
+    try:
+        with open(path, 'rb') as fdesc:
+            return json.loads(to_unicode(fdesc.read()))
+    except (IOError, OSError, ValueError):  # The file doesn't exist or is corrupt
+        return default
+
+
+def update_cache(key, data):
+    """Update an item in the cache"""
+    import json
+    path = os.path.join(get_cache_path(), '.'.join(key) + '.json')
+
+    # Write to a temporary file first, so we never leave a half-written file behind
+    with open(path + '.tmp', 'wb') as fdesc:
+        fdesc.write(json.dumps(data).encode('utf-8'))
+    if os.path.isfile(path):
+        os.remove(path)
+    os.rename(path + '.tmp', path)
+
+
 def get_addon_info(key, addon=None):
-    """Return addon information"""
-    if not addon:
-        addon = ADDON
-    return to_unicode(addon.getAddonInfo(key))
+    """Return addon information. The addon is an xbmcaddon.Addon, or the id of an add-on of which we cache the information."""
+    if hasattr(addon, 'getAddonInfo'):
+        return to_unicode(addon.getAddonInfo(key))
+    return _get_cached_info(addon, key, lambda: to_unicode((get_addon(addon) if addon else ADDON).getAddonInfo(key)))
+
+
+def _get_cached_info(name, key, lookup):
+    """Return what we cached about an add-on id, or look it up"""
+    info = _ADDON_INFO.setdefault(name, {})
+    if key not in info:
+        info[key] = lookup()
+    return info[key]
+
+
+def invalidate_addon_info(name=None):
+    """Forget what we cached about an add-on id, or about all add-ons"""
+    if name:
+        _ADDON_INFO.pop(name, None)
+    else:
+        _ADDON_INFO.clear()
 
 
 def jsonrpc(*args, **kwargs):
@@ -7,17 +7,36 @@ import sys
 import json
 import logging
 import os
-import re
 import socket
+import threading
 import time
 
 from resources.lib import kodiutils
+from resources.lib.modules import sources
+from resources.lib.modules.channel import Channel
+from resources.lib.modules.health import BACKOFF, RETRIES, Health
 from resources.lib.modules.iptvsimple import IptvSimple
+from resources.lib.modules.jsonstream import JsonEpgReader, JsonEpgWriter, JsonStringReader
+from resources.lib.modules.payload import Payload, receive
+from resources.lib.modules.receiver import Receiver
+from resources.lib.modules.timestamps import to_epoch
+from resources.lib.modules.xmltvstream import XmltvReader
+
+try:  # Python 3
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
 
 _LOGGER = logging.getLogger(__name__)
 
 CHANNELS_VERSION = 1
-EPG_VERSION = 1
+EPG_VERSION = 2
+
+# The compression formats that we accept in the reply of an add-on
+COMPRESSION = 'gzip,zlib'
+
+# Data that expires within this many seconds is refreshed already, so it doesn't expire right after a refresh
+EXPIRY_MARGIN = 60
 
 
 def update_qs(url, **params):
@@ -38,18 +57,33 @@ def update_qs(url, **params):
 class Addon:
     """Helper class for Addon communication"""
 
-    def __init__(self, addon_id, addon_obj, channels_uri, epg_uri):
+    # How long the last request for channels or EPG took, keyed on (addon_id, kind)
+    _durations = {}
+
+    # The parsed data of sources that can tell us when they haven't changed, keyed on URI
+    _unchanged = {}
+
+    def __init__(self, addon_id, addon_obj, channels_uri, epg_uri, refresh_intervals=None, info=None):  # pylint: disable=too-many-positional-arguments
         self.addon_id = addon_id
         self.addon_obj = addon_obj
         self.channels_uri = channels_uri
         self.epg_uri = epg_uri
 
-        addon = kodiutils.get_addon(addon_id)
-        self.addon_path = kodiutils.addon_path(addon)
+        # The refresh interval in seconds for 'channels' and 'epg', when the add-on specifies one
+        self.refresh_intervals = refresh_intervals or {}
+
+        # The name, icon and path of the add-on, when we know them already
+        self.info = info or {}
+
+    def get_info(self, key):
+        """Return the name, icon or path of the add-on"""
+        if not self.info.get(key):
+            self.info[key] = kodiutils.get_addon_info(key, self.addon_obj or self.addon_id)
+        return self.info[key]
 
     @classmethod
-    def refresh(cls, show_progress=False):
-        """Update channels and EPG data"""
+    def refresh(cls, show_progress=False, force=False):
+        """Update channels and EPG data. We only request data from add-ons when it has expired, unless we force it."""
         channels = []
         epg = []
 
@@ -58,41 +92,39 @@ class Addon:
         else:
             progress = None
 
-        addons = cls.detect_iptv_addons()
-        for index, addon in enumerate(addons):
-            _LOGGER.info('Updating IPTV data for %s...', addon.addon_id)
+        addons = cls._prioritize(cls.detect_iptv_addons())
+        if force:
+            for addon in addons:
+                addon.expire()
 
-            if progress:
-                # Fetching channels and guide of {addon}...
-                progress.update(int(100 * index / len(addons)),
-                                kodiutils.localize(30704).format(addon=kodiutils.addon_name(addon.addon_obj)))
+        # Fetch channels and EPG from all add-ons
+        results = cls._fetch_all(addons, kodiutils.get_setting_int('fetch_workers', 4), progress)
+        if results is None:
+            progress.close()
+            return
 
-            # Fetch channels
+        # Merge the results in the order of the add-ons, so our output stays stable and the preferred add-ons win
+        for index, addon in enumerate(addons):
             channels.append(dict(
                 addon_id=addon.addon_id,
-                addon_name=kodiutils.addon_name(addon.addon_obj),
-                channels=addon.get_channels(),
+                addon_name=addon.get_info('name'),
+                channels=results[(index, 'channels')],
             ))
-
-            if progress and progress.iscanceled():
-                progress.close()
-                return
-
-            # Fetch EPG
-            epg.append(addon.get_epg())
-
-            if progress and progress.iscanceled():
-                progress.close()
-                return
+            epg.append(results[(index, 'epg')])
 
         # Write files
         if show_progress:
             progress.update(100, kodiutils.localize(30705))  # Updating channels and guide...
 
-        IptvSimple.write_playlist(channels)
-        IptvSimple.write_epg(epg, channels)
+        playlist_changed = IptvSimple.write_playlist(channels)
+        epg_changed = IptvSimple.write_epg(epg, channels, progress=progress)
 
-        if kodiutils.get_setting_bool('iptv_simple_restart'):
+        # IPTV Simple only reads the playlist and the EPG when it starts
+        if not playlist_changed and not epg_changed:
+            _LOGGER.info('Not restarting IPTV Simple since the channels and guide did not change')
+        elif kodiutils.get_setting_bool('iptv_simple_restart'):
+            if not playlist_changed:
+                _LOGGER.info('Restarting IPTV Simple since the guide changed')
             if show_progress:
                 # Restart now.
                 IptvSimple.restart(True)
@@ -100,34 +132,374 @@ class Addon:
                 # Try to restart now. We will schedule it if the user is watching TV.
                 IptvSimple.restart(False)
 
-        # Update last_refreshed
+        # Update last_refreshed, and schedule a refresh for when the first add-on data expires
         kodiutils.set_setting_int('last_refreshed', int(time.time()))
+        kodiutils.set_setting_int('next_refresh', cls.next_expiry(addons))
 
         if show_progress:
             progress.close()
 
+    @staticmethod
+    def _prioritize(addons):
+        """Sort the add-ons so the preferred ones come first, they win when several add-ons have the same channel"""
+        preferred = [addon_id for addon_id in kodiutils.get_setting('channel_priority', '').split(',') if addon_id]
+        return sorted(addons, key=lambda addon: preferred.index(addon.addon_id) if addon.addon_id in preferred else len(preferred))
+
+    @classmethod
+    def _fetch_all(cls, addons, workers=1, progress=None):
+        """Fetch the channels and EPG of all add-ons with a pool of workers.
+        Returns a dict keyed on (index, 'channels'|'epg'), or None when the user canceled."""
+        jobs = [(index, kind) for index in range(len(addons)) for kind in ('channels', 'epg')]
+
+        # Start with the slowest add-ons, so they don't hold up the refresh at the end.
+        # Add-ons we haven't seen before could be slow, so they go first.
+        jobs.sort(key=lambda job: cls._durations.get((addons[job[0]].addon_id, job[1]), float('inf')), reverse=True)
+
+        pending = Queue()
+        for job in jobs:
+            pending.put(job)
+        finished = Queue()
+        canceled = threading.Event()
+
+        def worker():
+            """Process jobs until there are none left"""
+            while not canceled.is_set():
+                try:
+                    index, kind = pending.get_nowait()
+                except Empty:
+                    return
+
+                addon = addons[index]
+                result = [] if kind == 'channels' else {}
+                start = time.time()
+                try:
+                    if kind == 'channels':
+                        result = addon.get_channels()
+                    else:
+                        result = addon.get_epg()
+                except Exception as exc:  # pylint: disable=broad-except
+                    _LOGGER.error('Something went wrong while updating %s: %s', addon.addon_id, exc)
+                finally:
+                    cls._durations[(addon.addon_id, kind)] = time.time() - start
+                    finished.put((index, kind, result))
+
+        _LOGGER.debug('Fetching data from %d add-ons with %d workers', len(addons), workers)
+        for _ in range(max(1, min(workers, len(jobs)))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        results = {}
+        while len(results) < len(jobs):
+            try:
+                index, kind, result = finished.get(timeout=0.5)
+            except Empty:
+                if progress and progress.iscanceled():
+                    canceled.set()
+                    return None
+                continue
+
+            results[(index, kind)] = result
+
+            if progress:
+                # Fetching channels and guide of {addon}...
+                progress.update(int(100 * len(results) / len(jobs)),
+                                kodiutils.localize(30704).format(addon=addons[index].get_info('name')))
+                if progress.iscanceled():
+                    canceled.set()
+                    return None
+
+        return results
+
     @staticmethod
     def detect_iptv_addons():
-        """Find add-ons that provide IPTV channel data"""
-        result = kodiutils.jsonrpc(method="Addons.GetAddons",
-                                   params={'installed': True, 'enabled': True, 'type': 'xbmc.python.pluginsource'})
+        """Find add-ons that provide IPTV channel data. We remember what we found until add-ons are installed, enabled,
+        disabled or updated, but we check again when the settings of an add-on have changed."""
+        found = kodiutils.get_cache(('addons',))
+        if not found:
+            found = Addon._scan_addons()
+        else:
+            changed = [addon_id for addon_id, mtime in found['plugins'] if Addon._settings_mtime(addon_id) != mtime]
+            if changed:
+                Addon._rescan_addons(found, changed)
 
         addons = []
+        for addon_id, _ in found['plugins']:
+            provider = found['providers'].get(addon_id)
+            if provider:
+                addons.append(Addon(addon_id=addon_id, addon_obj=None, **provider))
+        return addons
+
+    @staticmethod
+    def invalidate_addons():
+        """Forget the add-ons we found, so we look for them again on the next refresh"""
+        kodiutils.update_cache(('addons',), {})
+        kodiutils.invalidate_addon_info()
+
+    @staticmethod
+    def _scan_addons():
+        """Check all add-ons if they provide IPTV channel data, and remember what we found"""
+        _LOGGER.debug('Looking for add-ons that support IPTV Manager...')
+        result = kodiutils.jsonrpc(method='Addons.GetAddons',
+                                   params={'installed': True, 'enabled': True, 'type': 'xbmc.python.pluginsource',
+                                           'properties': ['name', 'path']})
+
+        found = dict(plugins=[], providers={})
         for row in result['result'].get('addons', []):
-            addon = kodiutils.get_addon(row['addonid'])
+            found['plugins'].append((row['addonid'], Addon._settings_mtime(row['addonid'])))
+            provider = Addon._get_provider(row)
+            if provider:
+                found['providers'][row['addonid']] = provider
+
+        kodiutils.update_cache(('addons',), found)
+        return found
 
-            # Check if add-on supports IPTV Manager
-            if addon.getSetting('iptv.enabled') != 'true':
+    @staticmethod
+    def _rescan_addons(found, addon_ids):
+        """Check the add-ons of which the settings have changed again"""
+        _LOGGER.debug('Checking %s again since their settings have changed', ', '.join(addon_ids))
+        results = kodiutils.jsonrpc(*[dict(method='Addons.GetAddonDetails',
+                                           params={'addonid': addon_id, 'properties': ['name', 'path', 'enabled']})
+                                      for addon_id in addon_ids])
+
+        details = dict((addon_ids[result['id']], result.get('result', {}).get('addon')) for result in results)
+        plugins = []
+        for addon_id, mtime in found['plugins']:
+            if addon_id not in details:
+                plugins.append((addon_id, mtime))
                 continue
 
-            addons.append(Addon(
-                addon_id=row['addonid'],
-                addon_obj=addon,
-                channels_uri=addon.getSetting('iptv.channels_uri'),
-                epg_uri=addon.getSetting('iptv.epg_uri'),
-            ))
+            found['providers'].pop(addon_id, None)
+            row = details.get(addon_id)
+            if not row or not row.get('enabled', True):
+                continue
+            plugins.append((addon_id, Addon._settings_mtime(addon_id)))
+            provider = Addon._get_provider(row)
+            if provider:
+                found['providers'][addon_id] = provider
 
-        return addons
+        found['plugins'] = plugins
+        kodiutils.update_cache(('addons',), found)
+
+    @staticmethod
+    def _get_provider(row):
+        """Return what we need to know about an add-on that provides IPTV channel data, or None if it doesn't"""
+        addon = kodiutils.get_addon(row['addonid'])
+
+        # Check if add-on supports IPTV Manager
+        if addon.getSetting('iptv.enabled') != 'true':
+            return None
+
+        return dict(
+            channels_uri=addon.getSetting('iptv.channels_uri'),
+            epg_uri=addon.getSetting('iptv.epg_uri'),
+            refresh_intervals=dict(
+                channels=Addon._get_refresh_interval(addon, 'iptv.channels_refresh_interval'),
+                epg=Addon._get_refresh_interval(addon, 'iptv.epg_refresh_interval'),
+            ),
+            info=dict(
+                name=row.get('name') or kodiutils.addon_name(addon),
+                path=row.get('path') or kodiutils.addon_path(addon),
+                icon=kodiutils.addon_icon(addon),
+            ),
+        )
+
+    @staticmethod
+    def _settings_mtime(addon_id):
+        """Return when the settings of an add-on were last changed, or None if it has no settings"""
+        try:
+            return os.path.getmtime(kodiutils.get_addon_settings_path(addon_id))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _get_refresh_interval(addon, key):
+        """Return the refresh interval in seconds that an add-on specifies in hours, or None if it doesn't"""
+        for setting in (key, 'iptv.refresh_interval'):
+            try:
+                return int(float(addon.getSetting(setting)) * 3600)
+            except ValueError:
+                continue
+        return None
+
+    @staticmethod
+    def next_expiry(addons):
+        """Return the time when the data of the first add-on expires, or 0 if we don't know"""
+        expiries = [kodiutils.get_cache(('addon', addon.addon_id, kind), {}).get('expires')
+                    for addon in addons for kind in ('channels', 'epg')]
+        # Data that has expired already is data we could not refresh, we don't want to refresh again right away
+        now = time.time()
+        expiries = [expires for expires in expiries if expires and expires > now]
+        return int(min(expiries)) if expiries else 0
+
+    def expire(self):
+        """Forget when the channels and EPG of this add-on expire, so we request them again"""
+        for kind in ('channels', 'epg'):
+            kodiutils.update_cache(('addon', self.addon_id, kind), {})
+
+    def _get_payload(self, kind, uri):
+        """Return the channels or EPG payload of this add-on. We reuse the last payload when it hasn't expired."""
+        key = ('addon', self.addon_id, kind)
+        path = os.path.join(kodiutils.get_cache_path(), '.'.join(key) + '.body')
+        state = kodiutils.get_cache(key, {})
+        if state.get('uri') == uri and state.get('expires', 0) > time.time() + EXPIRY_MARGIN and os.path.isfile(path):
+            _LOGGER.info('Reusing %s of %s, it expires in %d minutes', kind, self.addon_id,
+                         (state.get('expires') - time.time()) / 60)
+            return Payload.from_file(path, changed=False)
+
+        # Skip add-ons that keep failing for a while, we use the data we have until then
+        if not Health.get(self.addon_id).available():
+            self._postpone(key, state)
+            if state.get('uri') == uri and os.path.isfile(path):
+                _LOGGER.warning('Skipping %s since it keeps failing, reusing its last %s', self.addon_id, kind)
+                return Payload.from_file(path, changed=False)
+            raise Exception('Skipping %s since it keeps failing' % self.addon_id)
+
+        try:
+            # Ask for the changes since the guide we have, when the add-on gave us a cursor last time
+            if kind == 'epg' and state.get('cursor') and state.get('uri') == uri and os.path.isfile(path):
+                payload = self._fetch(uri, since=state.get('cursor'))
+                try:
+                    payload = self._merge_epg(payload, path)
+                except ValueError as exc:
+                    # Start over with a full guide next time
+                    state = {}
+                    raise Exception('Could not merge the EPG changes of %s: %s' % (self.addon_id, exc))
+            else:
+                payload = self._fetch(uri, path=path)
+        except Exception:
+            self._postpone(key, state)
+            raise
+
+        # A source that we fetch ourselves can give us the file we keep already
+        try:
+            if payload.path != path:
+                payload.save(path)
+        except (IOError, OSError) as exc:
+            _LOGGER.warning('Could not store the %s of %s: %s', kind, self.addon_id, exc)
+            return payload
+
+        # Keep the TTL that the source specified last time when it tells us that nothing changed
+        ttl = state.get('ttl') if not payload.changed and state.get('uri') == uri else None
+        self._set_expiry(kind, uri, ttl)
+
+        # Continue with the stored EPG, so we can serialize it from its file
+        if kind == 'epg':
+            payload.close()
+            return Payload.from_file(path, changed=payload.changed)
+        return payload
+
+    def _postpone(self, key, state):
+        """Request the data again when the add-on could be working again, instead of on every check of the service"""
+        state['expires'] = Health.get(self.addon_id).retry_at()
+        kodiutils.update_cache(key, state)
+
+    def _fetch(self, uri, **params):
+        """Request data from the add-on. We retry failures with a backoff, but not timeouts, those would take too long."""
+        health = Health.get(self.addon_id)
+        for attempt in range(RETRIES + 1):
+            try:
+                payload = self._get_data_from_addon(uri, **params)
+            except (NotImplementedError, socket.timeout):
+                health.failed()
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                if attempt == RETRIES:
+                    health.failed()
+                    raise
+                delay = BACKOFF * 2 ** attempt
+                _LOGGER.warning('Request to %s failed, retrying in %d seconds: %s', self.addon_id, delay, exc)
+                time.sleep(delay)
+            else:
+                health.succeeded()
+                return payload
+        return None  # Not reached
+
+    def _set_expiry(self, kind, uri, ttl=None, cursor=None):
+        """Remember when the data expires. A TTL in the data takes precedence over the refresh interval.
+        The cursor is what we pass to the add-on next time to only receive the EPG changes."""
+        if ttl:
+            interval = int(ttl)
+        elif self.refresh_intervals.get(kind):
+            interval = self.refresh_intervals.get(kind)
+        else:
+            interval = kodiutils.get_setting_int('refresh_interval', 24) * 3600
+        kodiutils.update_cache(('addon', self.addon_id, kind),
+                               dict(uri=uri, expires=time.time() + interval, ttl=ttl, cursor=cursor))
+
+    def _merge_epg(self, payload, path):
+        """Merge a JSON-EPG delta reply into the guide that is stored in path. Returns a payload with the merged guide,
+        or the reply itself when the add-on sent us a full guide. Programmes are identified on their channel and start.
+        We drop the programmes that ended before the time window of epg_past_hours, so the guide doesn't keep growing."""
+        if payload.sniff() != '{':
+            return payload
+        data = self._load(payload)
+        if not data.get('delta'):
+            # The add-on sent us a full guide
+            return payload
+        payload.close()
+
+        if data.get('version', 1) > EPG_VERSION:
+            raise ValueError('unsupported version %s' % data.get('version'))
+
+        # Like the EPG we write, we keep all programmes that have ended when there is no time window
+        past_hours = kodiutils.get_setting_int('epg_past_hours', 0)
+        since = time.time() - past_hours * 3600 if past_hours else None
+        replaced = dict((channel, set(starts)) for channel, starts in data.get('removed', {}).items())
+        # The new programmes of every channel, the first one last, so we can pop them in start order
+        added = {}
+        for channel, programmes in data.get('epg', {}).items():
+            replaced.setdefault(channel, set()).update(programme.get('start') for programme in programmes)
+            added[channel] = sorted((programme for programme in programmes if not self._ended(programme, since)),
+                                    key=lambda programme: to_epoch(programme.get('start')) or 0, reverse=True)
+
+        meta = dict((key, value) for key, value in data.items() if key not in ('epg', 'removed', 'delta'))
+        merged = Payload()
+        writer = JsonEpgWriter(merged, meta)
+        count = dict(kept=0, removed=0, ended=0, added=0)
+
+        def add(channel, before=None):
+            """Write the new programmes of a channel that start before the epoch before, or all of them"""
+            pending = added.get(channel)
+            while pending and (before is None or (to_epoch(pending[-1].get('start')) or 0) < before):
+                writer.write(channel, pending.pop())
+                count['added'] += 1
+
+        with open(path, 'rb') as fdesc:
+            previous = None
+            for channel, programme in JsonEpgReader(fdesc):
+                # Add the new programmes that are left after the existing ones of their channel
+                if channel != previous:
+                    add(previous)
+                previous = channel
+
+                if programme.get('start') in replaced.get(channel, ()):
+                    count['removed'] += 1
+                elif self._ended(programme, since):
+                    count['ended'] += 1
+                else:
+                    start = to_epoch(programme.get('start')) if added.get(channel) else None
+                    if start is not None:
+                        add(channel, start)
+                    writer.write(channel, programme)
+                    count['kept'] += 1
+
+        # New channels, and the channel that we ended with
+        for channel in list(added):
+            add(channel)
+        writer.close()
+
+        _LOGGER.debug('Merged the EPG changes of %s: kept %d, replaced or removed %d, dropped %d that ended, added %d programmes',
+                      self.addon_id, count['kept'], count['removed'], count['ended'], count['added'])
+        return merged
+
+    @staticmethod
+    def _ended(programme, since):
+        """Returns True when a JSON-EPG programme ended before since, never when we keep everything"""
+        if since is None:
+            return False
+        stop = to_epoch(programme.get('stop'))
+        return stop is not None and stop < since
 
     def get_channels(self):
         """Get channel data from this add-on"""
@@ -136,12 +508,26 @@ class Addon:
             return []
 
         try:
-            data = self._get_data_from_addon(self.channels_uri)
+            with self._get_payload('channels', self.channels_uri) as payload:
+                if not payload.changed and self.channels_uri in self._unchanged:
+                    _LOGGER.debug('Reusing channels of %s since they were not modified', self.channels_uri)
+                    return self._unchanged[self.channels_uri]
+                data = self._load(payload)
             _LOGGER.debug(data)
+
+            if payload.changed and isinstance(data, dict) and data.get('ttl'):
+                self._set_expiry('channels', self.channels_uri, data.get('ttl'))
         except Exception as exc:  # pylint: disable=broad-except
             _LOGGER.error('Something went wrong while calling %s: %s', self.addon_id, exc)
             return []
 
+        channels = self._parse_channels(data)
+        self._unchanged[self.channels_uri] = channels
+        return channels
+
+    def _parse_channels(self, data):
+        """Parse channel data in M3U8 or JSON-STREAMS format"""
+
         # Return M3U8-format as-is without headers
         if not isinstance(data, dict):
             return data.replace('#EXTM3U\n', '')
@@ -161,9 +547,9 @@ class Addon:
 
             # Fix logo path to be absolute
             if not channel.get('logo'):
-                channel['logo'] = kodiutils.addon_icon(self.addon_obj)
+                channel['logo'] = self.get_info('icon')
             elif not channel.get('logo').startswith(('http://', 'https://', 'special://', 'resource://', '/')):
-                channel['logo'] = os.path.join(self.addon_path, channel.get('logo'))
+                channel['logo'] = os.path.join(self.get_info('path'), channel.get('logo'))
 
             # Ensure group is a set
             if not channel.get('group'):
@@ -180,9 +566,9 @@ class Addon:
                 _LOGGER.warning('Channel group is not a list: %s', channel)
                 channel['group'] = set()
             # Add add-on name as group, if not already
-            channel['group'].add(kodiutils.addon_name(self.addon_obj))
+            channel['group'].add(self.get_info('name'))
 
-            channels.append(channel)
+            channels.append(Channel.from_dict(channel))
 
         return channels
 
@@ -193,98 +579,168 @@ class Addon:
 
         _LOGGER.info('Requesting epg from %s...', self.epg_uri)
         try:
-            data = self._get_data_from_addon(self.epg_uri)
-            _LOGGER.debug(data)
+            payload = self._get_payload('epg', self.epg_uri)
+
+            # JSON-EPG format, we parse this while we are writing the EPG
+            sniff = payload.sniff()
+            if sniff == '{':
+                _LOGGER.debug('Received %d bytes of JSON-EPG data from %s', payload.size, self.addon_id)
+                return JsonEpg(self, payload)
         except Exception as exc:  # pylint: disable=broad-except
             _LOGGER.error('Something went wrong while calling %s: %s', self.addon_id, exc)
             return {}
 
-        # Return XMLTV-format as-is without headers and footers
-        if not isinstance(data, dict):
-            return re.search(r'<tv[^>]*>(.*)</tv>', data, flags=re.DOTALL).group(1).strip()
+        # XMLTV format, as-is or as a JSON string. We pass its channels and programmes through while we write the EPG.
+        _LOGGER.debug('Received %d bytes of XMLTV data from %s', payload.size, self.addon_id)
+        return XmltvEpg(self, payload, JsonStringReader(payload.open()) if sniff == '"' else payload.open())
 
-        # JSON-EPG format
-        if data.get('version', 1) > EPG_VERSION:
-            _LOGGER.warning('Skipping EPG from %s since it uses an unsupported version: %d', self.epg_uri,
-                            data.get('version'))
-            return {}
+    def _stream_epg(self, payload):
+        """Yield the (channel, programme) pairs of a JSON-EPG payload while we parse it"""
+        reader = JsonEpgReader(payload.open())
+        count = 0
+        try:
+            for channel, programme in reader:
+                # We can only check the version once we've seen it
+                if reader.meta.get('version', 1) > EPG_VERSION:
+                    break
+                count += 1
+                yield channel, programme
+        except ValueError as exc:
+            _LOGGER.error('Could not parse the EPG of %s: %s', self.addon_id, exc)
+            payload.close()
+            return
+        self._finish_epg(payload, reader.meta, count)
+
+    def _finish_epg(self, payload, meta, count):
+        """Check the JSON-EPG we have parsed, and keep the expiry it asks for"""
+        payload.close()
+        if meta.get('version', 1) > EPG_VERSION:
+            _LOGGER.warning('Skipping EPG from %s since it uses an unsupported version: %d', self.epg_uri, meta.get('version'))
+            return
 
         # Check for required fields
-        if not data.get('epg'):
+        if not count:
             _LOGGER.warning('Skipping EPG from %s since it is incomplete', self.epg_uri)
-            return {}
 
-        return data['epg']
+        if payload.changed and (meta.get('ttl') or meta.get('cursor')):
+            self._set_expiry('epg', self.epg_uri, meta.get('ttl'), meta.get('cursor'))
 
-    def _get_data_from_addon(self, uri):
-        """Request data from the specified URI"""
+    def _get_data_from_addon(self, uri, path=None, **params):
+        """Request data from the specified URI. Extra parameters are passed to plugin:// add-ons. The path is the file
+        where we keep the data, we download http:// and https:// URIs to it."""
         # Plugin path
         if uri.startswith('plugin://'):
             # Prepare data
-            sock = self._prepare_for_data()
-            uri = update_qs(uri, port=sock.getsockname()[1])
-
-            _LOGGER.info('Executing RunPlugin(%s)...', uri)
-            kodiutils.execute_builtin('RunPlugin', uri)
+            receiver = Receiver.instance()
+            with receiver.request(self.addon_id) as request:
+                # Add-ons that support it can send their reply compressed
+                uri = update_qs(uri, port=request.port, token=request.token, compression=COMPRESSION, **params)
 
-            # Wait for data
-            result = self._wait_for_data(sock)
+                _LOGGER.info('Executing RunPlugin(%s)...', uri)
+                kodiutils.execute_builtin('RunPlugin', uri)
 
-            # Load data
-            data = json.loads(result)
+                # Wait for data
+                return self._wait_for_data(request)
 
-            return data
+        # Remote or local file
+        if uri.startswith(('http://', 'https://', 'file://')):
+            _LOGGER.info('Fetching %s...', uri)
+            return sources.fetch(uri, path)
 
-        # Currently, only plugin:// uris are supported
         raise NotImplementedError
 
     @staticmethod
-    def _prepare_for_data():
-        """Prepare ourselves so we can receive data"""
-        # Bind on localhost on a free port above 1024
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(('localhost', 0))
-
-        _LOGGER.debug('Bound on port %s...', sock.getsockname()[1])
+    def _load(payload):
+        """Load the data of a payload. JSON is decoded, other data (like raw M3U8 or XMLTV) is returned as text."""
+        if payload.sniff() in ('{', '[', '"'):
+            return json.loads(payload.read_text())
+        return payload.read_text()
 
-        # Listen for one connection
-        sock.listen(1)
-        return sock
-
-    def _wait_for_data(self, sock, timeout=10):
+    def _wait_for_data(self, request, timeout=None):
         """Wait for data to arrive on the socket"""
-        # Set a connection timeout
-        # The remote and should connect back as soon as possible so we know that the request is being processed
-        sock.settimeout(timeout)
+        health = Health.get(self.addon_id)
+        if timeout is None:
+            timeout = health.timeout()
 
+        # The remote end should connect back as soon as possible so we know that the request is being processed
         try:
-            _LOGGER.debug('Waiting for a connection from %s on port %s...', self.addon_id, sock.getsockname()[1])
-
-            # Accept one client
-            conn, addr = sock.accept()
-            _LOGGER.debug('Connected to %s:%s! Waiting for result...', addr[0], addr[1])
+            _LOGGER.debug('Waiting %d seconds for a connection from %s on port %s...', timeout, self.addon_id,
+                          request.port)
+            start = time.time()
+            conn, head = request.wait(timeout)
+        except socket.timeout:
+            health.timed_out()
+            raise socket.timeout('Timeout waiting for reply from %s on port %s' % (self.addon_id, request.port))
+        health.connected(time.time() - start)
 
+        try:
             # We have no timeout when the connection is established
             conn.settimeout(None)
 
             # Read until the remote end closes the connection
-            buf = ''
-            while True:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                buf += chunk.decode()
+            payload = receive(conn, head)
 
-            if not buf:
+            if not payload.size:
                 # We got an empty reply, this means that something didn't go according to plan
+                payload.close()
                 raise Exception('Something went wrong in %s' % self.addon_id)
 
-            return buf
-
-        except socket.timeout:
-            raise Exception('Timout waiting for reply on port %s' % sock.getsockname()[1])
+            return payload
 
         finally:
-            # Close our socket
-            _LOGGER.debug('Closing socket on port %s', sock.getsockname()[1])
-            sock.close()
+            # Close the connection
+            conn.close()
+
+
+class JsonEpg:
+    """The JSON-EPG of an add-on. We parse it while we write the EPG, or serialize it from its file to a fragment."""
+
+    max_version = EPG_VERSION
+
+    def __init__(self, addon, payload):
+        """Initialise the JSON-EPG"""
+        self.addon = addon
+        self._payload = payload
+
+    def __iter__(self):
+        """Yield the (channel, programme) pairs of the JSON-EPG"""
+        return self.addon._stream_epg(self._payload)  # pylint: disable=protected-access
+
+    @property
+    def path(self):
+        """The file with the JSON-EPG, or None when it only exists in memory"""
+        return self._payload.path
+
+    def finish(self, meta, count, invalid=None):
+        """Process the result of serializing the JSON-EPG from its file"""
+        if invalid:
+            _LOGGER.error('Could not parse the EPG of %s: %s', self.addon.addon_id, invalid)
+            self._payload.close()
+            return
+        self.addon._finish_epg(self._payload, meta, count)  # pylint: disable=protected-access
+
+
+class XmltvEpg(XmltvReader):
+    """The XMLTV of an add-on. We pass its channels and programmes through while we write the EPG."""
+
+    def __init__(self, addon, payload, fdesc):
+        """Initialise the XMLTV on the file object of the payload"""
+        XmltvReader.__init__(self, fdesc)
+        self.addon = addon
+        self._payload = payload
+
+    def __iter__(self):
+        """Yield the (tag, attributes, element) tuples of the XMLTV"""
+        count = 0
+        try:
+            for element in XmltvReader.__iter__(self):
+                count += 1
+                yield element
+        except ValueError as exc:
+            _LOGGER.error('Could not parse the EPG of %s: %s', self.addon.addon_id, exc)
+        self._payload.close()
+
+        if self.skipped:
+            _LOGGER.warning('Skipped %d malformed elements in the EPG of %s', self.skipped, self.addon.addon_id)
+        if not count:
+            _LOGGER.warning('Skipping EPG from %s since it is incomplete', self.addon.epg_uri)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Channel Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+# The strings that repeat a lot in the channels, we only keep one copy of every one of them
+_SHARED = {}
+
+
+def share(value):
+    """Return the copy of a string that we keep, so a group that thousands of channels have only takes memory once"""
+    return _SHARED.setdefault(value, value)
+
+
+class Channel:
+    """A channel of an add-on in the JSON-STREAMS format. We keep the channels of all add-ons in memory between
+    refreshes, so they have slots instead of a dict, and their groups are a sorted tuple of shared strings."""
+
+    __slots__ = ('channel_id', 'name', 'stream', 'logo', 'preset', 'group', 'radio', 'kodiprops')
+
+    def __init__(self, channel_id, name, stream=None, logo=None, preset=None,  # pylint: disable=too-many-positional-arguments
+                 group=(), radio=False, kodiprops=None):
+        """Initialise the channel. The kodiprops are a dict or a sequence of (key, value) pairs."""
+        self.channel_id = channel_id
+        self.name = name
+        self.stream = stream
+        self.logo = logo
+        self.preset = preset
+        self.group = tuple(sorted(share(group_name) for group_name in group))
+        self.radio = bool(radio)
+        if isinstance(kodiprops, dict):
+            kodiprops = kodiprops.items()
+        self.kodiprops = tuple((share(key), share(value)) for key, value in kodiprops) if kodiprops else ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return the channel of a JSON-STREAMS dict"""
+        return cls(data.get('id'), data.get('name'), data.get('stream'), data.get('logo'), data.get('preset'),
+                   data.get('group') or (), data.get('radio'), data.get('kodiprops'))
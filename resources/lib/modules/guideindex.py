@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Guide Index Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import bisect
+from array import array
+
+
+class GuideIndex:
+    """Remember the channels and programmes that we have written to the EPG, so we don't write them twice.
+    The add-on that comes first wins. We only keep the channel ids, and the start and stop of every programme."""
+
+    def __init__(self, schedule=None):
+        """Initialise the index. We add the programmes we keep to the schedule, when we have one."""
+        self._schedule = schedule
+        self._channels = set()
+        # The sorted starts of the programmes of every channel, and their stops. A guide has hundreds of thousands of
+        # programmes, so we keep them in arrays of doubles instead of lists of ints.
+        self._programmes = {}
+        self.duplicate_channels = 0
+        self.duplicate_programmes = 0
+        self.overlapping_programmes = 0
+
+    def add_channel(self, channel_id):
+        """Add a channel. Returns False when we already have it."""
+        channel_id = channel_id.lower()
+        if channel_id in self._channels:
+            self.duplicate_channels += 1
+            return False
+        self._channels.add(channel_id)
+        return True
+
+    def add_programme(self, channel_id, start, stop, title=None):
+        """Add a programme with its epoch start and stop. Returns False when we already have a programme at that start,
+        or one that covers all of it."""
+        entry = self._programmes.get(channel_id)
+        if entry is None:
+            entry = self._programmes[channel_id] = (array('d'), array('d'))
+        starts, stops = entry
+
+        # The programmes of a channel usually arrive in order, so this is the last one most of the time
+        pos = bisect.bisect_right(starts, start)
+        if pos and starts[pos - 1] == start:
+            self.duplicate_programmes += 1
+            return False
+        if pos and stops[pos - 1] >= stop:
+            self.overlapping_programmes += 1
+            return False
+
+        starts.insert(pos, start)
+        stops.insert(pos, stop)
+        if self._schedule is not None:
+            self._schedule.add(channel_id, start, stop, title)
+        return True
+
+    def report(self):
+        """Return what we have merged, or None when nothing was merged"""
+        if not self.duplicate_channels and not self.duplicate_programmes and not self.overlapping_programmes:
+            return None
+        return '%d duplicate channels, %d duplicate programmes and %d overlapping programmes' % (
+            self.duplicate_channels, self.duplicate_programmes, self.overlapping_programmes)
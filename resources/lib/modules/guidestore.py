@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Guide Store Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import json
+import logging
+import os
+import sqlite3
+
+_LOGGER = logging.getLogger(__name__)
+
+GUIDE_STORE = 'guide.sqlite'
+
+# Increase the version when the schema or the XMLTV we store changes, so we start over with an empty store
+STORE_VERSION = 3
+
+# The programmes in the EPG we wrote last, by their lowercase channel id and epoch start
+SCHEDULE_TABLE = ('CREATE TABLE %s (channel_id TEXT NOT NULL, start REAL NOT NULL, stop REAL NOT NULL, title TEXT, '
+                  'PRIMARY KEY (channel_id, start)) WITHOUT ROWID')
+
+SCHEMA = [
+    # Every JSON-EPG we have serialized, by its digest, with the result of serializing it, and the time before which we
+    # removed programmes that ended
+    'CREATE TABLE sources (digest TEXT PRIMARY KEY, outcome TEXT NOT NULL, pruned REAL)',
+    # The XMLTV of every programme of a JSON-EPG, with its lowercase channel id, its epoch start and stop and its title
+    'CREATE TABLE programmes (source TEXT NOT NULL, channel_id TEXT NOT NULL, start REAL NOT NULL, stop REAL NOT NULL, '
+    'title TEXT, xml BLOB NOT NULL, PRIMARY KEY (source, channel_id, start)) WITHOUT ROWID',
+    'CREATE INDEX programmes_channel_start ON programmes (channel_id, start)',
+    'CREATE INDEX programmes_stop ON programmes (stop)',
+    SCHEDULE_TABLE % 'schedule',
+]
+
+# How many programmes we add to the schedule at once
+SCHEDULE_BATCH_SIZE = 1000
+
+
+class GuideStore:
+    """Keep the XMLTV of the programmes of every JSON-EPG in SQLite, so we only serialize a JSON-EPG when it changed and
+    can query the guide without parsing the EPG. The programmes of a JSON-EPG are stored once, in one transaction."""
+
+    def __init__(self, path):
+        """Open the store, we start over when it is from another version or when it is damaged"""
+        self._path = path
+        try:
+            self._conn = self._connect()
+        except sqlite3.DatabaseError as exc:
+            _LOGGER.warning('Starting over with an empty guide store since we could not open it: %s', exc)
+            os.remove(path)
+            self._conn = self._connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _connect(self):
+        """Connect to the database, and create the tables when it is new"""
+        conn = sqlite3.connect(self._path, timeout=30)
+        # The store is a cache that we can rebuild, so we don't wait for the disk
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA journal_mode = MEMORY')
+        if conn.execute('PRAGMA user_version').fetchone()[0] != STORE_VERSION:
+            with conn:
+                for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    conn.execute('DROP TABLE %s' % table)
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                conn.execute('PRAGMA user_version = %d' % STORE_VERSION)
+        return conn
+
+    def get_outcome(self, digest, since=None):
+        """Return the result of serializing the JSON-EPG with this digest, or None when we don't have its programmes.
+        We also return None when we removed programmes that ended after since, we need to serialize it again then."""
+        row = self._conn.execute('SELECT outcome, pruned FROM sources WHERE digest = ?', (digest,)).fetchone()
+        if not row or (row[1] is not None and (since is None or row[1] > since)):
+            return None
+        return json.loads(row[0])
+
+    def add(self, digest, outcome, programmes):
+        """Store the (channel_id, start, stop, title, xml) tuples of the programmes of a JSON-EPG. When a channel has
+        several programmes at the same start, we keep the first."""
+        with self._conn:
+            self._conn.execute('DELETE FROM programmes WHERE source = ?', (digest,))
+            self._conn.executemany('INSERT OR IGNORE INTO programmes (source, channel_id, start, stop, title, xml) VALUES (?, ?, ?, ?, ?, ?)',
+                                   ((digest, channel_id, start, stop, title, sqlite3.Binary(xml))
+                                    for channel_id, start, stop, title, xml in programmes))
+            self._conn.execute('INSERT OR REPLACE INTO sources (digest, outcome, pruned) VALUES (?, ?, NULL)', (digest, json.dumps(outcome)))
+
+    def programmes(self, digest, until=None):
+        """Yield the (channel_id, start, stop, title, xml) tuples of the programmes of a JSON-EPG that start before until,
+        by channel and start. We read them while we go."""
+        cursor = self._conn.execute('SELECT channel_id, start, stop, title, xml FROM programmes WHERE source = ? AND start <= ? '
+                                    'ORDER BY channel_id, start', (digest, until if until else float('inf')))
+        for channel_id, start, stop, title, xml in cursor:
+            yield channel_id, start, stop, title, bytes(xml)
+
+    def prune(self, since):
+        """Remove the programmes that ended before since. Returns how many we removed. We remember since for the JSON-EPG
+        we removed programmes of, so we know when we need them again."""
+        with self._conn:
+            self._conn.execute('UPDATE sources SET pruned = MAX(COALESCE(pruned, ?), ?) '
+                               'WHERE digest IN (SELECT DISTINCT source FROM programmes WHERE stop < ?)', (since, since, since))
+            return self._conn.execute('DELETE FROM programmes WHERE stop < ?', (since,)).rowcount
+
+    def digests(self):
+        """Return the digests of the JSON-EPG we have"""
+        return [digest for (digest,) in self._conn.execute('SELECT digest FROM sources').fetchall()]
+
+    def keep(self, digests):
+        """Remove the JSON-EPG of which the digest is not in digests, and their programmes"""
+        digests = set(digests)
+        unused = [digest for digest in self.digests() if digest not in digests]
+        with self._conn:
+            for digest in unused:
+                self._conn.execute('DELETE FROM programmes WHERE source = ?', (digest,))
+                self._conn.execute('DELETE FROM sources WHERE digest = ?', (digest,))
+
+    def schedule_writer(self):
+        """Return a ScheduleWriter that replaces the schedule"""
+        return ScheduleWriter(self._conn)
+
+    def get_now_next(self, channel_id, when):
+        """Return the (start, stop, title) of the programme of a channel at when, and of the one after it. Either is None
+        when the schedule doesn't have it."""
+        now = self._conn.execute('SELECT start, stop, title FROM schedule WHERE channel_id = ? AND start <= ? ORDER BY start DESC LIMIT 1',
+                                 (channel_id.lower(), when)).fetchone()
+        if now and now[1] <= when:
+            now = None
+        upcoming = self._conn.execute('SELECT start, stop, title FROM schedule WHERE channel_id = ? AND start > ? ORDER BY start LIMIT 1',
+                                      (channel_id.lower(), when)).fetchone()
+        return now, upcoming
+
+    def get_schedule(self, channel_id, since, until):
+        """Return the (start, stop, title) of the programmes of a channel between since and until"""
+        now, _ = self.get_now_next(channel_id, since)
+        programmes = self._conn.execute('SELECT start, stop, title FROM schedule WHERE channel_id = ? AND start > ? AND start < ? '
+                                        'ORDER BY start', (channel_id.lower(), since, until)).fetchall()
+        return ([now] if now else []) + programmes
+
+    def close(self):
+        """Close the store"""
+        self._conn.close()
+
+
+class ScheduleWriter:
+    """Write the schedule of the EPG while we write the EPG. We only replace the schedule when we're done, so whoever
+    looks something up in the meantime still has the previous one."""
+
+    def __init__(self, conn):
+        """Start a new schedule"""
+        self._conn = conn
+        self._batch = []
+        with self._conn:
+            self._conn.execute('DROP TABLE IF EXISTS schedule_new')
+            self._conn.execute(SCHEDULE_TABLE % 'schedule_new')
+
+    def add(self, channel_id, start, stop, title):
+        """Add a programme to the schedule"""
+        self._batch.append((channel_id, start, stop, title))
+        if len(self._batch) == SCHEDULE_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Write the programmes we have collected"""
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO schedule_new (channel_id, start, stop, title) VALUES (?, ?, ?, ?)', self._batch)
+        del self._batch[:]
+
+    def close(self):
+        """Replace the schedule with the new one"""
+        self._flush()
+        with self._conn:
+            self._conn.execute('DROP TABLE schedule')
+            self._conn.execute('ALTER TABLE schedule_new RENAME TO schedule')
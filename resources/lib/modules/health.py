@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Health Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import logging
+import threading
+import time
+
+from resources.lib import kodiutils
+
+_LOGGER = logging.getLogger(__name__)
+
+# How long we wait for an add-on to connect when we know nothing about it, and the bounds of what we learn
+DEFAULT_TIMEOUT = 10
+MIN_TIMEOUT = 5
+MAX_TIMEOUT = 60
+
+# The weight of a new measurement in the moving averages of the latency
+SMOOTHING = 0.25
+
+# How often we retry a request that failed, and how long we wait before the first retry (this doubles every time)
+RETRIES = 2
+BACKOFF = 1
+
+# After this many failed requests in a row, we skip the add-on for a while (this doubles every time it fails again)
+FAILURE_THRESHOLD = 3
+COOLDOWN = 15 * 60
+MAX_COOLDOWN = 24 * 3600
+
+# How long we wait before we request the data of an add-on again after a request failed
+RETRY_DELAY = 5 * 60
+
+
+class Health:
+    """Keeps track of the latency and the failures of an add-on, so we know how long to wait for it,
+    and when we should stop trying for a while"""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, addon_id):
+        """Initialise the Health from what we know from previous runs"""
+        self.addon_id = addon_id
+        self._lock = threading.Lock()
+        self._state = kodiutils.get_cache(('health', addon_id), {})
+
+    @classmethod
+    def get(cls, addon_id):
+        """Return the Health of an add-on"""
+        with cls._instances_lock:
+            if addon_id not in cls._instances:
+                cls._instances[addon_id] = Health(addon_id)
+            return cls._instances[addon_id]
+
+    def timeout(self):
+        """Return how long we should wait for the add-on to connect"""
+        latency = self._state.get('latency')
+        if latency is None:
+            timeout = DEFAULT_TIMEOUT
+        else:
+            timeout = max(2 * latency, latency + 4 * self._state.get('deviation', 0))
+
+        # Wait longer after every timeout, the add-on could be slow instead of down
+        timeout *= 2 ** self._state.get('timeouts', 0)
+        return min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def available(self):
+        """Returns False when the add-on has failed too often, and we should skip it for now"""
+        return self._state.get('open_until', 0) <= time.time()
+
+    def retry_at(self):
+        """Return when we should request the data of the add-on again after a request failed"""
+        return max(self._state.get('open_until', 0), time.time() + RETRY_DELAY)
+
+    def connected(self, latency):
+        """Remember how long it took the add-on to connect"""
+        with self._lock:
+            if self._state.get('latency') is None:
+                self._state.update(latency=latency, deviation=latency / 2)
+            else:
+                deviation = abs(latency - self._state['latency'])
+                self._state['latency'] += SMOOTHING * (latency - self._state['latency'])
+                self._state['deviation'] += SMOOTHING * (deviation - self._state['deviation'])
+            self._state['timeouts'] = 0
+            self._save()
+
+    def timed_out(self):
+        """Remember that the add-on didn't connect in time"""
+        with self._lock:
+            self._state['timeouts'] = min(self._state.get('timeouts', 0) + 1, 3)
+            self._save()
+
+    def succeeded(self):
+        """Remember that a request succeeded"""
+        with self._lock:
+            if not self._state.get('failures'):
+                return
+            _LOGGER.info('%s is working again', self.addon_id)
+            self._state.update(failures=0, open_until=0)
+            self._save()
+
+    def failed(self):
+        """Remember that a request failed, and skip the add-on for a while when it keeps failing"""
+        with self._lock:
+            failures = self._state.get('failures', 0) + 1
+            self._state['failures'] = failures
+            if failures >= FAILURE_THRESHOLD:
+                cooldown = min(COOLDOWN * 2 ** (failures - FAILURE_THRESHOLD), MAX_COOLDOWN)
+                self._state['open_until'] = time.time() + cooldown
+                _LOGGER.warning('%s failed %d times in a row, we will skip it for %d minutes',
+                                self.addon_id, failures, cooldown / 60)
+            self._save()
+
+    def _save(self):
+        """Store the state, so we remember it after a restart"""
+        try:
+            kodiutils.update_cache(('health', self.addon_id), self._state)
+        except (IOError, OSError) as exc:
+            _LOGGER.warning('Could not store the health of %s: %s', self.addon_id, exc)
@@ -3,8 +3,14 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import re
+import sys
 import time
 
 import glob
@@ -12,16 +18,64 @@ import shutil
 
 import xbmcvfs
 
-import dateutil.parser
-import dateutil.tz
-
 from resources.lib import kodiutils
+from resources.lib.modules.channel import Channel
+from resources.lib.modules.guideindex import GuideIndex
+from resources.lib.modules.guidestore import GUIDE_STORE, GuideStore
+from resources.lib.modules.xmltv import ProgrammeSerializer, serialize_file, xml_encode
+from resources.lib.modules.xmltvstream import XmltvReader
 
 _LOGGER = logging.getLogger(__name__)
 
 IPTV_SIMPLE_ID = 'pvr.iptvsimple'
 IPTV_SIMPLE_PLAYLIST = 'playlist.m3u8'
 IPTV_SIMPLE_EPG = 'epg.xml'
+IPTV_SIMPLE_EPG_GZIP = 'epg.xml.gz'
+
+# The channel ids in RAW M3U8 data
+M3U_CHANNEL_ID = re.compile(r'tvg-id="([^"]*)"')
+
+# The size of the write buffer of the playlist and the EPG
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# We serialize every JSON-EPG to a fragment in this cache directory, before we store it in the GuideStore. Increase the
+# version when the fragments we write change, so we don't use the programmes we stored before.
+FRAGMENT_DIR = 'fragments'
+FRAGMENT_VERSION = 1
+
+# How many programmes we join before we write them to the EPG
+WRITE_BATCH_SIZE = 256
+
+# The size of the chunks we read when we hash a file
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+class DigestWriter:
+    """Write to a file while we compute the digest of everything we write"""
+
+    def __init__(self, fdesc):
+        """Initialise the writer"""
+        self._fdesc = fdesc
+        self._digest = hashlib.sha1()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        """Write data to the file"""
+        self._digest.update(data)
+        self._fdesc.write(data)
+
+    def hexdigest(self):
+        """Return the digest of everything we wrote"""
+        return self._digest.hexdigest()
+
+    def close(self):
+        """Close the file"""
+        self._fdesc.close()
 
 
 class IptvSimple:
@@ -56,7 +110,7 @@ class IptvSimple:
         addon.setSetting('m3uPath', os.path.join(output_dir, IPTV_SIMPLE_PLAYLIST))
 
         addon.setSetting('epgPathType', '0')  # Local path
-        addon.setSetting('epgPath', os.path.join(output_dir, IPTV_SIMPLE_EPG))
+        addon.setSetting('epgPath', os.path.join(output_dir, cls._epg_filename()))
         addon.setSetting('epgCache', 'true')
         addon.setSetting('epgTimeShift', '0')
 
@@ -105,9 +159,9 @@ class IptvSimple:
         """Deactivate IPTV Simple"""
         kodiutils.jsonrpc(method="Addons.SetAddonEnabled", params={"addonid": IPTV_SIMPLE_ID, "enabled": False})
 
-    @staticmethod
-    def write_playlist(channels):
-        """Write playlist data"""
+    @classmethod
+    def write_playlist(cls, channels):
+        """Write playlist data. Returns False when it's the same as what we wrote last time."""
         output_dir = kodiutils.addon_profile()
 
         # Make sure our output dir exists
@@ -117,206 +171,301 @@ class IptvSimple:
         # Write playlist for IPTV Simple
         playlist_path = os.path.join(output_dir, IPTV_SIMPLE_PLAYLIST)
 
-        with open(playlist_path + '.tmp', 'wb') as fdesc:
-            m3u8_data = '#EXTM3U\n'
+        # We write every channel as soon as it's formatted, so we never have the whole playlist in memory
+        with DigestWriter(open(playlist_path + '.tmp', 'wb', WRITE_BUFFER_SIZE)) as fdesc:
+            fdesc.write('#EXTM3U\n'.encode('utf-8'))
 
             for addon in channels:
-                m3u8_data += '## {addon_name}\n'.format(**addon)
+                fdesc.write('## {addon_name}\n'.format(**addon).encode('utf-8'))
 
                 # RAW M3U8 data
                 if not isinstance(addon['channels'], list):
-                    m3u8_data += addon['channels']
+                    fdesc.write(addon['channels'].encode('utf-8'))
                     continue
 
                 # JSON-STREAMS format
                 for channel in addon['channels']:
-                    m3u8_data += '#EXTINF:-1 tvg-name="{name}"'.format(**channel)
-                    if channel.get('id'):
-                        m3u8_data += ' tvg-id="{id}"'.format(**channel)
-                    if channel.get('logo'):
-                        m3u8_data += ' tvg-logo="{logo}"'.format(**channel)
-                    if channel.get('preset'):
-                        m3u8_data += ' tvg-chno="{preset}"'.format(**channel)
-                    if channel.get('group'):
-                        m3u8_data += ' group-title="{groups}"'.format(groups=';'.join(channel.get('group')))
-                    if channel.get('radio'):
-                        m3u8_data += ' radio="true"'
-                    m3u8_data += ' catchup="vod",{name}\n'.format(**channel)
-                    if channel.get('kodiprops'):
-                        for key, value in channel.get('kodiprops').items():
-                            m3u8_data += '#KODIPROP:{key}={value}\n'.format(key=key, value=value)
-                    m3u8_data += '{stream}\n\n'.format(**channel)
-
-            fdesc.write(m3u8_data.encode('utf-8'))
+                    fdesc.write(cls._construct_m3u_channel(channel).encode('utf-8'))
 
-        # Move new file to the right place
-        if os.path.isfile(playlist_path):
-            os.remove(playlist_path)
+        return cls._replace(playlist_path, fdesc.hexdigest())
 
-        os.rename(playlist_path + '.tmp', playlist_path)
+    @staticmethod
+    def _construct_m3u_channel(channel):
+        """Return the M3U8 entry of a channel"""
+        entry = ['#EXTINF:-1 tvg-name="{name}"'.format(name=channel.name)]
+        if channel.channel_id:
+            entry.append(' tvg-id="{id}"'.format(id=channel.channel_id))
+        if channel.logo:
+            entry.append(' tvg-logo="{logo}"'.format(logo=channel.logo))
+        if channel.preset:
+            entry.append(' tvg-chno="{preset}"'.format(preset=channel.preset))
+        if channel.group:
+            entry.append(' group-title="{groups}"'.format(groups=';'.join(channel.group)))
+        if channel.radio:
+            entry.append(' radio="true"')
+        entry.append(' catchup="vod",{name}\n'.format(name=channel.name))
+        for key, value in channel.kodiprops:
+            entry.append('#KODIPROP:{key}={value}\n'.format(key=key, value=value))
+        entry.append('{stream}\n\n'.format(stream=channel.stream))
+        return ''.join(entry)
 
     @classmethod
-    def write_epg(cls, epg_list, channels):
-        """Write EPG data"""
+    def write_epg(cls, epg_list, channels, progress=None):
+        """Write EPG data. Returns False when it's the same as what we wrote last time."""
         output_dir = kodiutils.addon_profile()
 
         # Make sure our output dir exists
         if not os.path.exists(output_dir):
             os.mkdir(output_dir)
 
-        epg_path = os.path.join(output_dir, IPTV_SIMPLE_EPG)
-
-        # Write XML file by hand
-        # The reason for this is that it takes less memory to write the file line by line then to construct an
-        # XML object in memory and writing that in one go.
-        # We can't depend on lxml.etree.xmlfile, since that's not available as a Kodi module
-        with open(epg_path + '.tmp', 'wb') as fdesc:
-            fdesc.write('<?xml version="1.0" encoding="UTF-8"?>\n'.encode('utf-8'))
-            fdesc.write('<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'.encode('utf-8'))
-            fdesc.write('<tv>\n'.encode('utf-8'))
+        compression = kodiutils.get_setting_int('epg_compression', 0)
+        epg_path = os.path.join(output_dir, cls._epg_filename(compression))
+
+        # RAW XMLTV data in a string is read like the XMLTV of an add-on
+        epg_list = [
+            XmltvReader(io.BytesIO(epg.encode('utf-8')))
+            if isinstance(epg, str) or (sys.version_info.major == 2 and isinstance(epg, unicode)) else epg  # noqa: F821; pylint: disable=undefined-variable
+            for epg in epg_list
+        ]
+
+        # Add an icon ourselves in Kodi 18. We drop the programmes of channels that IPTV Simple doesn't know, and the
+        # programmes outside the time window we keep.
+        options = dict(vod_titles=kodiutils.kodi_version_major() < 19, channels=cls._channel_index(channels, epg_list))
+        past_hours = kodiutils.get_setting_int('epg_past_hours', 0)
+        if past_hours:
+            options['since'] = time.time() - past_hours * 3600
+        future_days = kodiutils.get_setting_int('epg_future_days', 0)
+        if future_days:
+            options['until'] = time.time() + future_days * 86400
+
+        # We keep the programmes of every JSON-EPG in the GuideStore, and only serialize a JSON-EPG again when it changed.
+        # When we merge the programmes of the add-ons in order, we skip the channels and programmes that an add-on before
+        # it already had.
+        store = GuideStore(os.path.join(kodiutils.get_cache_path(), GUIDE_STORE))
+        schedule = store.schedule_writer()
+        guide_index = GuideIndex(schedule)
+        if options.get('since'):
+            _LOGGER.debug('Removed %d programmes that ended before the time window from the guide store', store.prune(options.get('since')))
+        fragment_dir = os.path.join(kodiutils.get_cache_path(), FRAGMENT_DIR)
+        fragments = cls._fragment_paths(fragment_dir, epg_list, options.get('vod_titles'))
 
-            # Write channel info
-            for addon in channels:
-                for channel in addon.get('channels'):
-                    if isinstance(channel, dict) and channel.get('id'):
-                        fdesc.write('<channel id="{id}">\n'.format(id=cls._xml_encode(channel.get('id'))).encode('utf-8'))
-                        fdesc.write(' <display-name>{name}</display-name>\n'.format(name=cls._xml_encode(channel.get('name'))).encode('utf-8'))
-                        if channel.get('logo'):
-                            fdesc.write(' <icon src="{logo}"/>\n'.format(logo=cls._xml_encode(channel.get('logo'))).encode('utf-8'))
-                        fdesc.write('</channel>\n'.encode('utf-8'))
-
-            for epg in epg_list:
-                # RAW XMLTV data
-                if not isinstance(epg, dict):
-                    fdesc.write(epg.encode('utf-8'))
-                    fdesc.write('\n'.encode('utf-8'))
-                    continue
+        try:
+            # Write XML file by hand
+            # The reason for this is that it takes less memory to write the file line by line then to construct an
+            # XML object in memory and writing that in one go.
+            # We can't depend on lxml.etree.xmlfile, since that's not available as a Kodi module
+            with DigestWriter(cls._open_epg(epg_path + '.tmp', compression)) as fdesc:
+                fdesc.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                            '<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'
+                            '<tv>\n'.encode('utf-8'))
+
+                # Write channel info
+                for addon in channels:
+                    for channel in addon.get('channels'):
+                        if isinstance(channel, Channel) and channel.channel_id and guide_index.add_channel(channel.channel_id):
+                            fdesc.write('<channel id="{id}">\n'.format(id=xml_encode(channel.channel_id)).encode('utf-8'))
+                            fdesc.write(' <display-name>{name}</display-name>\n'.format(name=xml_encode(channel.name)).encode('utf-8'))
+                            if channel.logo:
+                                fdesc.write(' <icon src="{logo}"/>\n'.format(logo=xml_encode(channel.logo)).encode('utf-8'))
+                            fdesc.write('</channel>\n'.encode('utf-8'))
+
+                serializer = ProgrammeSerializer(index=guide_index, **options)
+
+                for index, epg in enumerate(epg_list):
+                    if progress:
+                        progress.update(int(100 * index / len(epg_list)), kodiutils.localize(30705))  # Updating channels and guide...
+
+                    # JSON-EPG data from a file, we serialize it to a fragment unless we have stored it
+                    if index in fragments and cls._merge_fragment(fdesc, epg, guide_index, options, store, fragments[index]):
+                        continue
+
+                    # RAW XMLTV data, we pass its channels and programmes through
+                    if isinstance(epg, XmltvReader):
+                        for tag, attributes, element in epg:
+                            element = serializer.passthrough(tag, attributes, element)
+                            if element is not None:
+                                fdesc.write(element.encode('utf-8'))
+                                fdesc.write('\n'.encode('utf-8'))
+                        continue
+
+                    # JSON-EPG data, as a dict or as a stream of (channel, program) pairs
+                    if isinstance(epg, dict):
+                        epg = ((key, item) for key, items in epg.items() for item in items)
+
+                    # Write program info
+                    for key, item in epg:
+                        try:
+                            program = serializer.serialize(item, key)
+                        except Exception as exc:  # pylint: disable=broad-except
+                            # When we encounter an error, log an error, but don't error out for the other programs
+                            _LOGGER.error('Could not parse item: %s', item)
+                            _LOGGER.exception(exc)
+                            continue
+                        if program is not None:
+                            fdesc.write(program.encode('utf-8'))
+
+                fdesc.write('</tv>\n'.encode('utf-8'))
+                schedule.close()
+
+                if serializer.dropped:
+                    _LOGGER.debug('Dropped %d programmes of unknown channels or outside the time window', serializer.dropped)
+                if guide_index.report():
+                    _LOGGER.info('Merged %s in the EPG', guide_index.report())
+        finally:
+            store.keep(os.path.basename(fragment_path) for fragment_path in fragments.values())
+            store.close()
+            for fragment_path in fragments.values():
+                for path in (fragment_path + '.xml', fragment_path + '.idx'):
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+        changed = cls._replace(epg_path, fdesc.hexdigest())
+
+        # Remove the EPG we wrote before we switched between compressed and uncompressed output
+        old_path = os.path.join(output_dir, IPTV_SIMPLE_EPG if compression else IPTV_SIMPLE_EPG_GZIP)
+        if os.path.isfile(old_path):
+            os.remove(old_path)
+            cls._switch_epg_path(old_path, epg_path)
+
+        return changed
 
-                # Write program info
-                for _, key in enumerate(epg):
-                    for item in epg[key]:
-                        program = cls._construct_epg_program_xml(item, key)
-                        fdesc.write(program.encode('utf-8'))
+    @staticmethod
+    def _channel_index(channels, epg_list):
+        """Return the lowercase ids of all channels, IPTV Simple can only show the programmes of these channels"""
+        index = set()
+        for addon in channels:
+            # RAW M3U8 data
+            if not isinstance(addon['channels'], list):
+                index.update(channel_id.lower() for channel_id in M3U_CHANNEL_ID.findall(addon['channels']))
+                continue
+
+            # JSON-STREAMS format
+            index.update(channel.channel_id.lower() for channel in addon['channels'] if channel.channel_id)
+
+        # RAW XMLTV data has its own channels
+        for epg in epg_list:
+            if isinstance(epg, XmltvReader):
+                index.update(channel_id.lower() for channel_id in epg.channel_ids())
+        return index
 
-            fdesc.write('</tv>\n'.encode('utf-8'))
+    @staticmethod
+    def _replace(path, digest):
+        """Move a new file in place, unless it's the same as what we wrote last time. Returns True when it changed."""
+        key = ('output', os.path.basename(path))
+        if os.path.isfile(path) and kodiutils.get_cache(key) == digest:
+            _LOGGER.debug('Keeping %s since nothing changed', path)
+            os.remove(path + '.tmp')
+            return False
 
         # Move new file to the right place
-        if os.path.isfile(epg_path):
-            os.remove(epg_path)
+        if os.path.isfile(path):
+            os.remove(path)
 
-        os.rename(epg_path + '.tmp', epg_path)
+        os.rename(path + '.tmp', path)
+        kodiutils.update_cache(key, digest)
+        return True
+
+    @staticmethod
+    def _epg_filename(compression=None):
+        """Return the filename of the EPG, it depends on the compression"""
+        if compression is None:
+            compression = kodiutils.get_setting_int('epg_compression', 0)
+        return IPTV_SIMPLE_EPG_GZIP if compression else IPTV_SIMPLE_EPG
+
+    @staticmethod
+    def _open_epg(path, compression):
+        """Open the EPG for writing. With a compression level, we stream it through gzip while we write it."""
+        if not compression:
+            return open(path, 'wb', WRITE_BUFFER_SIZE)
+        # The gzip module compresses every write, so we collect small writes in a buffer first
+        return io.BufferedWriter(gzip.open(path, 'wb', compression), WRITE_BUFFER_SIZE)
 
     @classmethod
-    def _construct_epg_program_xml(cls, item, channel):
-        """ Generate the XML for the EPG of a program. """
+    def _switch_epg_path(cls, old_path, new_path):
+        """Point IPTV Simple to the EPG we write now, when it used the one we wrote before"""
         try:
-            start = dateutil.parser.parse(item.get('start')).strftime('%Y%m%d%H%M%S %z').rstrip()
-            stop = dateutil.parser.parse(item.get('stop')).strftime('%Y%m%d%H%M%S %z').rstrip()
-            title = item.get('title', '')
-
-            # Add an icon ourselves in Kodi 18
-            if kodiutils.kodi_version_major() < 19 and item.get('stream'):
-                # We use a clever way to hide the direct URI in the label so Kodi 18 can access the it
-                title = '%s [COLOR green]•[/COLOR][COLOR vod="%s"][/COLOR]' % (
-                    title, item.get('stream')
-                )
-
-            program = '<programme start="{start}" stop="{stop}" channel="{channel}"{vod}>\n'.format(
-                start=start,
-                stop=stop,
-                channel=cls._xml_encode(channel),
-                vod=' catchup-id="%s"' % cls._xml_encode(item.get('stream')) if item.get('stream') else '')
-
-            program += ' <title>{title}</title>\n'.format(
-                title=cls._xml_encode(title))
-
-            if item.get('subtitle'):
-                program += ' <sub-title>{subtitle}</sub-title>\n'.format(
-                    subtitle=cls._xml_encode(item.get('subtitle')))
-
-            if item.get('description'):
-                program += ' <desc>{description}</desc>\n'.format(
-                    description=cls._xml_encode(item.get('description')))
-
-            if item.get('credits'):
-                program += ' <credits>\n'
-                for credit in item.get('credits'):
-                    # IPTV Simple only supports `actor`, `director` and `writer`, so we need to narrow the options down.
-                    # actor -> actor (with optional role)
-                    # director -> director
-                    # writer -> writer
-                    # adapter -> writer
-                    # producer -> director
-                    # composer -> writer
-                    # editor -> writer
-                    # presenter -> actor
-                    # commentator -> actor
-                    # guest -> actor
-
-                    if credit.get('type') == 'actor':
-                        if credit.get('role'):
-                            program += '  <actor role="{role}">{name}</actor>\n'.format(role=cls._xml_encode(credit.get('role')),
-                                                                                        name=cls._xml_encode(credit.get('name')))
-                        else:
-                            program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'director':
-                        program += '  <director>{name}</director>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'writer':
-                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'adapter':
-                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'producer':
-                        program += '  <director>{name}</director>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'composer':
-                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'editor':
-                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'presenter':
-                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'commentator':
-                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
-                    elif credit.get('type') == 'guest':
-                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
-
-                program += ' </credits>\n'
-
-            if item.get('date'):
-                program += ' <date>{date}</date>\n'.format(
-                    date=cls._xml_encode(item.get('date')))
-
-            if item.get('genre'):
-                if isinstance(item.get('genre'), list):
-                    for genre in item.get('genre'):
-                        program += ' <category>{genre}</category>\n'.format(
-                            genre=cls._xml_encode(genre))
-                else:
-                    program += ' <category>{genre}</category>\n'.format(
-                        genre=cls._xml_encode(item.get('genre')))
-
-            if item.get('image'):
-                program += ' <icon src="{image}"/>\n'.format(
-                    image=cls._xml_encode(item.get('image')))
-
-            if item.get('episode'):
-                program += ' <episode-num system="onscreen">{episode}</episode-num>\n'.format(
-                    episode=cls._xml_encode(item.get('episode')))
-
-            program += '</programme>\n'
-            return program
+            addon = kodiutils.get_addon(IPTV_SIMPLE_ID)
+        except RuntimeError:  # IPTV Simple is not installed
+            return
+        if addon.getSetting('epgPath') != old_path:
+            return
+        _LOGGER.info('Configuring IPTV Simple to use %s', new_path)
+        cls.setup()
 
+    @classmethod
+    def _fragment_paths(cls, fragment_dir, epg_list, vod_titles):
+        """Return the path of the fragment of every JSON-EPG file by its position. The name of a fragment is the digest
+        we store its programmes with."""
+        if not os.path.exists(fragment_dir):
+            os.mkdir(fragment_dir)
+        return {index: os.path.join(fragment_dir, cls._fragment_key(epg, vod_titles))
+                for index, epg in enumerate(epg_list) if getattr(epg, 'path', None)}
+
+    @staticmethod
+    def _fragment_key(epg, vod_titles):
+        """Return the digest of a JSON-EPG file. It changes when the JSON-EPG or the way we serialize it changes."""
+        digest = hashlib.sha1(('%d:%s:%s:' % (FRAGMENT_VERSION, epg.max_version, bool(vod_titles))).encode('utf-8'))
+        with open(epg.path, 'rb') as fdesc:
+            for chunk in iter(lambda: fdesc.read(HASH_BUFFER_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _serialize_fragment(epg, fragment_path, vod_titles):
+        """Return the result of serializing a JSON-EPG file to its fragment. Returns None when that failed."""
+        try:
+            return serialize_file(epg.path, fragment_path + '.xml', epg.max_version, fragment_path + '.idx', vod_titles=vod_titles)
         except Exception as exc:  # pylint: disable=broad-except
-            # When we encounter an error, log an error, but don't error out for the other programs
-            _LOGGER.error('Could not parse item: %s', item)
-            _LOGGER.exception(exc)
-            return ''
+            _LOGGER.warning('Serializing the EPG of %s in the service, since we could not write its fragment: %s', epg.addon.addon_id, exc)
+            return None
 
     @staticmethod
-    def _xml_encode(value):
-        """Quick and dirty encoding for XML values"""
-        if value is None:
-            return ''
-        return value \
-            .replace('&', '&amp;') \
-            .replace('<', '&lt;') \
-            .replace('>', '&gt;') \
-            .replace('"', '&quot;')
+    def _read_fragment(fragment_path):
+        """Yield the (channel_id, start, stop, title, xml) tuples of the programmes in a fragment"""
+        # Every line of the index has the channel, start, stop, title and size of the next programme in the fragment
+        with open(fragment_path + '.xml', 'rb') as fragment, open(fragment_path + '.idx', 'rb') as index:
+            # Decoding the lines in one go is a lot faster than decoding them one by one
+            entries = json.loads('[%s]' % index.read().decode('utf-8').rstrip('\n').replace('\n', ','))
+            for channel, start, stop, title, size in entries:
+                yield channel, start, stop, title, fragment.read(size)
+
+    @classmethod
+    def _merge_fragment(cls, fdesc, epg, guide_index, options, store, fragment_path):  # pylint: disable=too-many-positional-arguments
+        """Append the programmes of a JSON-EPG file, without the programmes we drop or that the GuideIndex already has.
+        We store the programmes of a JSON-EPG we serialized, unless it was incomplete. Returns False when we have no
+        programmes."""
+        digest = os.path.basename(fragment_path)
+        outcome = store.get_outcome(digest, options.get('since'))
+        programmes = None
+        if outcome is None:
+            outcome = cls._serialize_fragment(epg, fragment_path, options.get('vod_titles'))
+            if outcome is None:
+                return False
+            programmes = cls._read_fragment(fragment_path)
+            if not outcome.get('invalid'):
+                store.add(digest, outcome, programmes)
+                programmes = None
+
+        for item, error in outcome.get('failed'):
+            _LOGGER.error('Could not parse item: %s', item)
+            _LOGGER.error(error)
+        epg.finish(outcome.get('meta'), outcome.get('count'), outcome.get('invalid'))
+
+        channels = options.get('channels')
+        since, until = options.get('since') or float('-inf'), options.get('until') or float('inf')
+        dropped = 0
+        # We write the programmes in batches, that's a lot less calls for the digest and the compression
+        batch = []
+        for channel, start, stop, title, programme in programmes or store.programmes(digest, options.get('until')):
+            if (channels is not None and channel not in channels) or stop < since or start > until:
+                dropped += 1
+            elif guide_index.add_programme(channel, start, stop, title):
+                batch.append(programme)
+                if len(batch) == WRITE_BATCH_SIZE:
+                    fdesc.write(b''.join(batch))
+                    del batch[:]
+        fdesc.write(b''.join(batch))
+
+        if dropped:
+            _LOGGER.debug('Dropped %d programmes of %s of unknown channels or outside the time window', dropped, epg.addon.addon_id)
+        return True
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Incremental JSON-EPG parser"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+# The first half of a surrogate pair, like \ud83d in \ud83d\ude00
+HIGH_SURROGATE = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}')
+
+
+class JsonEpgReader:
+    """Parse a JSON-EPG document while reading it, and yield (channel_id, programme) pairs.
+
+    Only one programme is decoded at a time, so the memory usage doesn't depend on the size of the guide.
+    The other top-level keys of the document (like `version`) are available in `meta` once they are parsed.
+    """
+
+    def __init__(self, fdesc, chunk_size=CHUNK_SIZE):
+        """Initialise the reader on a binary file object"""
+        self.meta = {}
+        self._fdesc = fdesc
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        """Yield all (channel_id, programme) pairs of the document"""
+        self._expect('{')
+        if self._peek() == '}':
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'epg' and self._peek() == '{':
+                for pair in self._channels():  # pylint: disable=use-yield-from  # Python 2
+                    yield pair
+            else:
+                self.meta[key] = self._value()
+
+            if self._next() == '}':
+                return
+
+    def _channels(self):
+        """Yield the programmes of the `epg` object"""
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            channel = self._value()
+            self._expect(':')
+            self._expect('[')
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                while True:
+                    yield channel, self._value()
+                    if self._next() == ']':
+                        break
+
+            if self._next() == '}':
+                return
+
+    def _fill(self):
+        """Read the next chunk. Returns False when there is nothing left to read."""
+        if self._eof:
+            return False
+
+        # Drop the part that we already parsed
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        chunk = self._fdesc.read(self._chunk_size)
+        self._eof = not chunk
+        self._buf += self._decoder.decode(chunk, final=self._eof)
+        return True
+
+    def _peek(self):
+        """Return the next character that isn't whitespace, without consuming it"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON-EPG data')
+
+    def _next(self):
+        """Consume the next character, it should be a separator or the end of an object or array"""
+        char = self._peek()
+        if char not in ',]}':
+            raise ValueError('Unexpected character %r at position %d of JSON-EPG data' % (char, self._pos))
+        self._pos += 1
+        return char
+
+    def _expect(self, expected):
+        """Consume the next character, and check that it's what we expect"""
+        char = self._peek()
+        if char != expected:
+            raise ValueError('Expected %r but got %r in JSON-EPG data' % (expected, char))
+        self._pos += 1
+
+    def _value(self):
+        """Decode the next JSON value"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+                # A number could continue in the next chunk
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+
+            # Read until we have at least twice the data, so large values don't get decoded over and over
+            size = len(self._buf) - self._pos
+            while len(self._buf) - self._pos < 2 * size and self._fill():
+                pass
+
+
+class JsonEpgWriter:
+    """Write a JSON-EPG document one (channel_id, programme) pair at a time.
+    The programmes of a channel should be written one after the other."""
+
+    def __init__(self, fdesc, meta):
+        """Initialise the writer on a binary file object, and write the top-level keys in `meta`"""
+        self._fdesc = fdesc
+        self._channel = None
+        self._write('{')
+        for key, value in meta.items():
+            self._write('%s: %s, ' % (json.dumps(key), json.dumps(value)))
+        self._write('"epg": {')
+
+    def write(self, channel, programme):
+        """Write a programme of a channel"""
+        if channel == self._channel:
+            self._write(', ')
+        else:
+            self._write('%s%s: [' % ('], ' if self._channel is not None else '', json.dumps(channel)))
+            self._channel = channel
+        self._write(json.dumps(programme))
+
+    def close(self):
+        """Finish the document"""
+        self._write('%s}}' % (']' if self._channel is not None else ''))
+
+    def _write(self, text):
+        """Write text as UTF-8"""
+        self._fdesc.write(text.encode('utf-8'))
+
+
+class JsonStringReader:
+    """Decode a JSON document that is a single string while reading it, like the XMLTV that an add-on sends with
+    json.dumps(). This is a binary file object that returns the string as UTF-8."""
+
+    # An escape sequence is at most this long, like a surrogate pair 😀
+    MAX_ESCAPE = 12
+
+    def __init__(self, fdesc, chunk_size=CHUNK_SIZE):
+        """Initialise the reader on a binary file object"""
+        self._fdesc = fdesc
+        self._chunk_size = chunk_size
+        self._json = json.JSONDecoder(strict=False)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._scanned = 0
+        self._started = False
+        self._done = False
+
+    def seek(self, offset):
+        """Start over, we can only seek to the start"""
+        if offset:
+            raise ValueError('Can only seek to the start of a JSON string')
+        self._fdesc.seek(0)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._scanned = 0
+        self._started = False
+        self._done = False
+
+    def read(self, size=-1):  # pylint: disable=unused-argument
+        """Return the next part of the string as UTF-8, or nothing at the end. The size is ignored."""
+        while not self._done:
+            chunk = self._fdesc.read(self._chunk_size)
+            self._buf += self._decoder.decode(chunk, final=not chunk)
+
+            if not self._started:
+                stripped = self._buf.lstrip(WHITESPACE)
+                if stripped and stripped[0] != '"' or not stripped and not chunk:
+                    raise ValueError('Expected a JSON string')
+                if not stripped:
+                    continue
+                self._buf = stripped[1:]
+                self._started = True
+
+            end = self._closing_quote()
+            if end is not None:
+                part, self._buf, self._done = self._buf[:end], '', True
+            elif not chunk:
+                raise ValueError('Unexpected end of JSON string')
+            else:
+                # Keep an escape sequence that could continue in the next chunk
+                cut = len(self._buf)
+                backslash = self._buf.find('\\', max(0, cut - self.MAX_ESCAPE))
+                if backslash != -1:
+                    cut = backslash - 1 if self._escaped(backslash) else backslash
+                if HIGH_SURROGATE.match(self._buf, max(0, cut - 6), cut):
+                    cut -= 6
+                part, self._buf = self._buf[:cut], self._buf[cut:]
+                self._scanned = len(self._buf)
+
+            if part:
+                return self._json.decode('"%s"' % part).encode('utf-8', 'replace')
+        return b''
+
+    def _closing_quote(self):
+        """Return the position of the quote that ends the string, or None when we haven't read it yet. We only look
+        at the part of the buffer that we haven't scanned before."""
+        pos = self._buf.find('"', self._scanned)
+        while pos != -1:
+            if not self._escaped(pos):
+                return pos
+            pos = self._buf.find('"', pos + 1)
+        self._scanned = len(self._buf)
+        return None
+
+    def _escaped(self, pos):
+        """Return True when the character at pos follows an odd number of backslashes"""
+        start = pos - 1
+        while start >= 0 and self._buf[start] == '\\':
+            start -= 1
+        return (pos - 1 - start) % 2 == 1
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Payload Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import codecs
+import logging
+import os
+import shutil
+import tempfile
+import zlib
+
+_LOGGER = logging.getLogger(__name__)
+
+# How much we read from the socket at once
+RECV_SIZE = 64 * 1024
+
+# Payloads that are larger than this are spilled to a temporary file
+MAX_MEMORY = 16 * 1024 * 1024
+
+# Gzipped data starts with these bytes
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class Payload:
+    """The data we received from an add-on. It's kept in memory until it grows too large, then it's spilled to disk."""
+
+    def __init__(self, max_memory=MAX_MEMORY, directory=None):
+        """Initialise the Payload"""
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory, dir=directory)  # pylint: disable=consider-using-with
+        self.size = 0
+
+        # The file with the payload, when it's not a temporary one
+        self.path = None
+
+        # False when the source told us that this is the same data as last time
+        self.changed = True
+
+    @classmethod
+    def from_file(cls, path, changed=True):
+        """Return a payload with the contents of an existing file"""
+        payload = cls.__new__(cls)
+        payload._file = open(path, 'rb')  # pylint: disable=consider-using-with,protected-access
+        payload.size = os.path.getsize(path)
+        payload.path = path
+        payload.changed = changed
+        return payload
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        """Append data to the payload"""
+        self._file.write(data)
+        self.size += len(data)
+
+    def open(self):
+        """Return a binary file object to read the payload from the start"""
+        self._file.seek(0)
+        return self._file
+
+    def sniff(self):
+        """Return the first character that isn't whitespace, so we can detect the format of the payload"""
+        fdesc = self.open()
+        while True:
+            chunk = fdesc.read(1024)
+            if not chunk:
+                return None
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0:1].decode('utf-8', 'ignore')
+
+    def read_text(self, chunk_size=RECV_SIZE):
+        """Decode the payload as UTF-8. We decode chunk by chunk, so we never have a copy of all the bytes in memory."""
+        fdesc = self.open()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts = []
+        while True:
+            chunk = fdesc.read(chunk_size)
+            parts.append(decoder.decode(chunk, final=not chunk))
+            if not chunk:
+                break
+        return ''.join(parts)
+
+    def save(self, path):
+        """Store a copy of the payload in a file"""
+        with open(path + '.tmp', 'wb') as fdesc:
+            shutil.copyfileobj(self.open(), fdesc, RECV_SIZE)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    @property
+    def spilled(self):
+        """Returns True if the payload was spilled to disk"""
+        return getattr(self._file, '_rolled', True)
+
+    def close(self):
+        """Discard the payload"""
+        self._file.close()
+
+
+def receive(conn, head=b'', recv_size=RECV_SIZE, max_memory=MAX_MEMORY, directory=None):
+    """Read from the connection until the remote end closes it. Compressed data is decompressed while we receive it."""
+    payload = Payload(max_memory=max_memory, directory=directory)
+    received = 0
+    try:
+        # Read enough to detect if the data is compressed
+        chunk = head
+        while len(chunk) < 2:
+            more = conn.recv(recv_size)
+            if not more:
+                break
+            chunk += more
+        decomp = decompressor(detect_compression(chunk))
+
+        while chunk:
+            received += len(chunk)
+            payload.write(decomp.decompress(chunk) if decomp else chunk)
+            chunk = conn.recv(recv_size)
+
+        if decomp:
+            payload.write(decomp.flush())
+            if not getattr(decomp, 'eof', True):
+                raise Exception('Compressed data is incomplete')
+    except Exception:
+        payload.close()
+        raise
+
+    _LOGGER.debug('Received %d bytes%s%s', payload.size,
+                  ' (%d bytes compressed)' % received if decomp else '',
+                  ' (spilled to disk)' if payload.spilled else '')
+    return payload
+
+
+def detect_compression(data):
+    """Return the content encoding of data that starts with a gzip or zlib header, or None when it isn't compressed"""
+    if data.startswith(GZIP_MAGIC):
+        return 'gzip'
+    # A zlib header starts with 0x78 and the first two bytes are a multiple of 31, text that starts with "x" isn't
+    header = bytearray(data[:2])
+    if len(header) == 2 and header[0] == 0x78 and (header[0] * 256 + header[1]) % 31 == 0:
+        return 'deflate'
+    return None
+
+
+def decompressor(encoding):
+    """Return a decompressor for the specified content encoding, or None when the data isn't compressed"""
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding in (None, '', 'identity'):
+        return None
+    raise ValueError('Unsupported content encoding %s' % encoding)
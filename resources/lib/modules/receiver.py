@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""Receiver Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import binascii
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+try:  # Python 3
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
+
+_LOGGER = logging.getLogger(__name__)
+
+# Add-ons that support it start their reply with this header, followed by the token they received and a newline
+TOKEN_HEADER = b'token='
+TOKEN_HEADER_MAX = len(TOKEN_HEADER) + 64
+
+# Connections that we couldn't route are dropped after this many seconds
+UNROUTED_TIMEOUT = 60
+
+
+def split_token(data):
+    """Split the token header from the data. Returns (token, data), or (None, data) when there is no header.
+    Raises ValueError when the header is incomplete."""
+    if not data.startswith(TOKEN_HEADER):
+        if data and TOKEN_HEADER.startswith(data):
+            raise ValueError('Incomplete token header')
+        return None, data
+    end = data.find(b'\n')
+    if end == -1:
+        if len(data) < TOKEN_HEADER_MAX:
+            raise ValueError('Incomplete token header')
+        return None, data
+    return data[len(TOKEN_HEADER):end].strip().decode('ascii', 'ignore'), data[end + 1:]
+
+
+class Request:
+    """A request that waits for the reply of an add-on. An add-on that sends us a token replies on the port of the
+    receiver. Any other add-on replies on a port of its own, so the port tells us who the reply belongs to."""
+
+    def __init__(self, receiver, addon_id):
+        """Initialise the Request"""
+        self.addon_id = addon_id
+        self.token = binascii.hexlify(os.urandom(8)).decode('ascii')
+        self._receiver = receiver
+        self._replies = Queue()
+        if addon_id in receiver.token_aware:
+            self._sock = None
+            self.port = receiver.port
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.bind(('localhost', 0))
+            self._sock.listen(1)
+            self.port = self._sock.getsockname()[1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def deliver(self, conn):
+        """Hand over a connection that was routed on its token to this request"""
+        self._replies.put(conn)
+
+    def wait(self, timeout):
+        """Wait for the connection of the add-on. Returns the connection and the data that was already read."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                conn = self._accept(deadline)
+            except socket.timeout:
+                # The add-on could have stopped sending a token, we listen on a port of its own next time
+                self._receiver.token_aware.discard(self.addon_id)
+                raise socket.timeout('Timeout waiting for a connection from %s' % self.addon_id)
+
+            # This connection was routed on its token
+            if self._sock is None:
+                return conn, b''
+
+            # This connection is on our own port, but the add-on could still send a token
+            head = b''
+            while True:
+                chunk = conn.recv(TOKEN_HEADER_MAX)
+                head += chunk
+                try:
+                    token, data = split_token(head)
+                    break
+                except ValueError:
+                    if not chunk:
+                        token, data = None, head
+                        break
+
+            if token is None or token == self.token:
+                if token:
+                    self._receiver.token_aware.add(self.addon_id)
+                return conn, data
+
+            # This is a reply for somebody else, we are still waiting for ours
+            _LOGGER.debug('Forwarding a reply for token %s that was sent to the port of %s', token, self.addon_id)
+            self._receiver.forward(token, conn, data)
+
+    def _accept(self, deadline):
+        """Return the next connection for this request. Raises socket.timeout when there is none before the deadline."""
+        remaining = deadline - time.time()
+        if self._sock is None:
+            try:
+                return self._replies.get(timeout=max(remaining, 0))
+            except Empty:
+                raise socket.timeout()
+        if remaining <= 0:
+            raise socket.timeout()
+        self._sock.settimeout(remaining)
+        conn, _ = self._sock.accept()
+        conn.settimeout(None)
+        return conn
+
+    def close(self):
+        """Stop waiting for a reply"""
+        self._receiver.unregister(self)
+        if self._sock is not None:
+            self._sock.close()
+
+        # Close connections that we didn't pick up
+        while True:
+            try:
+                conn = self._replies.get_nowait()
+            except Empty:
+                break
+            conn.close()
+
+
+class PrefixedConnection:
+    """A connection where some data was already read from"""
+
+    def __init__(self, conn, prefix):
+        """Initialise the connection"""
+        self._conn = conn
+        self._prefix = prefix
+
+    def recv(self, bufsize):
+        """Return the data that was already read, and then read from the connection"""
+        if self._prefix:
+            data, self._prefix = self._prefix[:bufsize], self._prefix[bufsize:]
+            return data
+        return self._conn.recv(bufsize)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class Receiver:
+    """A long-lived listener that receives the replies of all add-ons that send a token on one port"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    # Add-ons that have sent us a token, so we know that we can route their replies on it
+    token_aware = set()
+
+    def __init__(self):
+        """Bind on localhost on a free port above 1024 and start listening"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(('localhost', 0))
+        self._sock.listen(socket.SOMAXCONN)
+        self.port = self._sock.getsockname()[1]
+
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._unrouted = {}
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='IPTVManagerReceiver')
+        self._thread.daemon = True
+        self._thread.start()
+
+        _LOGGER.debug('Receiver listening on port %s...', self.port)
+
+    @classmethod
+    def instance(cls):
+        """Return the running receiver, start one if needed"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = Receiver()
+            return cls._instance
+
+    @classmethod
+    def shutdown(cls):
+        """Stop the running receiver"""
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.stop()
+                cls._instance = None
+
+    def stop(self):
+        """Stop listening"""
+        _LOGGER.debug('Closing receiver on port %s', self.port)
+        self._running = False
+        self._sock.close()
+        self._thread.join(5)
+        with self._lock:
+            for conn in self._unrouted:
+                conn.close()
+            self._unrouted.clear()
+
+    def request(self, addon_id):
+        """Register a new request. This has to happen before we invoke the add-on."""
+        request = Request(self, addon_id)
+        with self._lock:
+            self._requests[request.token] = request
+        return request
+
+    def unregister(self, request):
+        """Forget about a request"""
+        with self._lock:
+            self._requests.pop(request.token, None)
+
+    def forward(self, token, conn, data):
+        """Forward a connection to the request with the specified token"""
+        with self._lock:
+            request = self._requests.get(token)
+        if request is None:
+            _LOGGER.warning('Dropping a reply for unknown token %s', token)
+            conn.close()
+            return
+        self.token_aware.add(request.addon_id)
+        request.deliver(PrefixedConnection(conn, data))
+
+    def _run(self):
+        """Accept and route connections until we are stopped"""
+        while self._running:
+            with self._lock:
+                unrouted = list(self._unrouted)
+
+            try:
+                readable, _, _ = select.select([self._sock] + unrouted, [], [], 1)
+            except (select.error, socket.error, ValueError):
+                if not self._running:
+                    break
+                continue
+
+            for sock in readable:
+                if sock is self._sock:
+                    try:
+                        conn, addr = self._sock.accept()
+                    except socket.error:
+                        continue
+                    _LOGGER.debug('Connected to %s:%s! Waiting for result...', addr[0], addr[1])
+                    with self._lock:
+                        self._unrouted[conn] = (time.time(), b'')
+                else:
+                    self._route(sock)
+
+            # Drop connections that never send us a token
+            now = time.time()
+            with self._lock:
+                for conn, (accepted, _) in list(self._unrouted.items()):
+                    if now - accepted > UNROUTED_TIMEOUT:
+                        _LOGGER.warning('Dropping a connection that we could not route')
+                        del self._unrouted[conn]
+                        conn.close()
+
+    def _route(self, conn):
+        """Route a connection that has sent us some data. We collect the token header of a connection in its own
+        buffer, since a connection stays readable when it sent part of it, or when it closed."""
+        try:
+            chunk = conn.recv(TOKEN_HEADER_MAX)
+        except socket.error:
+            chunk = b''
+
+        with self._lock:
+            if conn not in self._unrouted:  # We are stopping
+                return
+            accepted, head = self._unrouted.pop(conn)
+            head += chunk
+            try:
+                token, data = split_token(head)
+            except ValueError:
+                if chunk:
+                    # Wait for the rest of the header
+                    self._unrouted[conn] = (accepted, head)
+                    return
+                token, data = None, head
+
+        if token is None:
+            _LOGGER.warning('Dropping a reply without a token')
+            conn.close()
+            return
+
+        self.forward(token, conn, data)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Sources Module"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+
+from resources.lib import kodiutils
+from resources.lib.modules.payload import GZIP_MAGIC, RECV_SIZE, Payload, decompressor
+
+try:  # Python 3
+    from http.client import HTTPConnection, HTTPException, HTTPSConnection
+    from urllib.parse import urljoin, urlparse
+    from urllib.request import url2pathname
+except ImportError:  # Python 2
+    from httplib import HTTPConnection, HTTPException, HTTPSConnection
+    from urllib import url2pathname
+    from urlparse import urljoin, urlparse
+
+_LOGGER = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 30
+MAX_REDIRECTS = 5
+
+# Idle connections that we can reuse, keyed on (scheme, netloc)
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def fetch(uri, path=None):
+    """Fetch the data of a http://, https:// or file:// URI. Returns a Payload. The path is the file where the caller
+    keeps the data of this URI. We store the data in it, and return it when the data didn't change, so there is one
+    copy."""
+    if uri.startswith('file://'):
+        return _fetch_file(uri, path)
+    return _fetch_http(uri, path)
+
+
+def close():
+    """Close the connections that we kept around"""
+    with _CONNECTIONS_LOCK:
+        for conns in _CONNECTIONS.values():
+            for conn in conns:
+                conn.close()
+        _CONNECTIONS.clear()
+
+
+def _cache_key(uri, path=None):
+    """Return the cache key for the state of a source, and the file where the caller keeps its data"""
+    return 'source', hashlib.sha1((uri if path is None else '%s\n%s' % (uri, path)).encode('utf-8')).hexdigest()
+
+
+def _fetch_file(uri, body_path=None):
+    """Read a local file. The payload is marked as unchanged when the file wasn't modified since last time."""
+    path = url2pathname(urlparse(uri).path)
+    stat = os.stat(path)
+
+    key = _cache_key(uri, body_path)
+    state = dict(mtime=stat.st_mtime, size=stat.st_size)
+    changed = kodiutils.get_cache(key) != state
+    if not changed:
+        _LOGGER.debug('%s was not modified since last time', path)
+        if body_path and os.path.isfile(body_path):
+            return Payload.from_file(body_path, changed=False)
+
+    # Store the data before we remember the state of the file, like we do with a download
+    if body_path:
+        with open(path, 'rb') as fdesc:
+            _store(fdesc, body_path, None)
+        kodiutils.update_cache(key, state)
+        return Payload.from_file(body_path, changed=changed)
+
+    if changed:
+        kodiutils.update_cache(key, state)
+    with open(path, 'rb') as fdesc:
+        if fdesc.read(len(GZIP_MAGIC)) != GZIP_MAGIC:
+            return Payload.from_file(path, changed=changed)
+
+        # Decompress gzipped files
+        fdesc.seek(0)
+        payload = Payload()
+        _copy(fdesc, payload, None)
+        payload.changed = changed
+        return payload
+
+
+def _fetch_http(uri, body_path=None):
+    """Download a http:// or https:// URI. We reuse connections and only download data that has changed."""
+    key = _cache_key(uri, body_path)
+    state = kodiutils.get_cache(key, {})
+    if body_path is None:
+        body_path = os.path.join(kodiutils.get_cache_path(), '.'.join(key) + '.body')
+
+    headers = {'Accept-Encoding': 'gzip, deflate'}
+    if os.path.isfile(body_path):
+        if state.get('etag'):
+            headers['If-None-Match'] = state.get('etag')
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state.get('last_modified')
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlparse(uri)
+        conn, response = _request(parts, headers)
+        try:
+            if response.status in (301, 302, 303, 307, 308):
+                uri = urljoin(uri, response.getheader('Location'))
+                _LOGGER.debug('Redirected to %s', uri)
+                continue
+
+            if response.status == 304:
+                _LOGGER.debug('%s was not modified since last time', uri)
+                return Payload.from_file(body_path, changed=False)
+
+            if response.status != 200:
+                raise Exception('Unexpected HTTP status %d for %s' % (response.status, uri))
+
+            # Store the data, so we can use it again when the server tells us it's not modified
+            _store(response, body_path, response.getheader('Content-Encoding'))
+
+            kodiutils.update_cache(key, dict(
+                etag=response.getheader('ETag'),
+                last_modified=response.getheader('Last-Modified'),
+            ))
+            return Payload.from_file(body_path)
+
+        finally:
+            # Read what's left, so we can reuse the connection
+            response.read()
+            _release(parts, conn, response)
+
+    raise Exception('Too many redirects for %s' % uri)
+
+
+def _request(parts, headers):
+    """Send a GET request on a kept-alive connection. Returns the connection and the response."""
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    conn = _acquire(parts)
+    try:
+        conn.request('GET', path, headers=headers)
+        return conn, conn.getresponse()
+    except (HTTPException, socket.error):
+        conn.close()
+
+    # The server could have closed the idle connection, so we try again once on a new connection
+    conn = _acquire(parts, fresh=True)
+    conn.request('GET', path, headers=headers)
+    return conn, conn.getresponse()
+
+
+def _acquire(parts, fresh=False):
+    """Return an idle connection to the host, or open a new one"""
+    key = (parts.scheme, parts.netloc)
+    if not fresh:
+        with _CONNECTIONS_LOCK:
+            if _CONNECTIONS.get(key):
+                return _CONNECTIONS[key].pop()
+
+    if parts.scheme == 'https':
+        return HTTPSConnection(parts.netloc, timeout=HTTP_TIMEOUT)
+    return HTTPConnection(parts.netloc, timeout=HTTP_TIMEOUT)
+
+
+def _release(parts, conn, response):
+    """Keep the connection around, so we can reuse it for the next request to this host"""
+    if response.will_close:
+        conn.close()
+        return
+    with _CONNECTIONS_LOCK:
+        _CONNECTIONS.setdefault((parts.scheme, parts.netloc), []).append(conn)
+
+
+def _store(source, body_path, encoding):
+    """Copy data from a file object to the file where we keep it. We write a temporary file first, so we never leave
+    half of the data behind."""
+    tmp_path = '%s.%d.tmp' % (body_path, threading.current_thread().ident)
+    with open(tmp_path, 'wb') as fdesc:
+        _copy(source, fdesc, encoding)
+    if os.path.isfile(body_path):
+        os.remove(body_path)
+    os.rename(tmp_path, body_path)
+
+
+def _copy(source, destination, encoding):
+    """Copy data from a file object and decompress it on the fly. Gzipped data is detected on its magic bytes."""
+    decomp = decompressor(encoding)
+    first = True
+    while True:
+        chunk = source.read(RECV_SIZE)
+        if not chunk:
+            break
+        if decomp:
+            chunk = decomp.decompress(chunk)
+        if first and chunk:
+            first = False
+            if chunk.startswith(GZIP_MAGIC) and not decomp:
+                decomp = decompressor('gzip')
+                chunk = decomp.decompress(chunk)
+        destination.write(chunk)
+    if decomp:
+        destination.write(decomp.flush())
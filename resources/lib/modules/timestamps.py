@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Convert the timestamps of JSON-EPG programmes to the XMLTV format"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import calendar
+import re
+from datetime import datetime, timedelta
+
+import dateutil.parser
+
+# The ISO 8601 timestamps that add-ons send almost all the time, like 2021-01-23T11:42:55+01:00, 2021-01-23T10:42:55Z
+# or 2021-01-23T11:42:55. Fractions of a second are dropped in the XMLTV format.
+ISO_8601 = re.compile(r'([1-9]\d{3})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.\d+)?(Z|[+-]\d\d(?::?\d\d)?)?$')
+
+EPOCH = datetime(1970, 1, 1)
+
+# The XMLTV suffix of the UTC offsets we have seen, like ' +0100' for '+01:00'
+_OFFSETS = {None: '', 'Z': ' +0000'}
+
+# The start of the days and the UTC offsets of XMLTV timestamps, in seconds
+_DAYS = {}
+_OFFSET_SECONDS = {}
+
+# The most recent conversions, the stop of a programme is usually the start of the next one
+_RECENT = {}
+_RECENT_MAX = 1024
+
+
+def to_xmltv(value):
+    """Convert a timestamp to the XMLTV format, like 20210123114255 +0100. Epoch timestamps are in UTC.
+    The result is the same as dateutil.parser.parse(value).strftime('%Y%m%d%H%M%S %z').rstrip()."""
+    try:
+        return _RECENT[value]
+    except (KeyError, TypeError):
+        pass
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (EPOCH + timedelta(seconds=value)).strftime('%Y%m%d%H%M%S +0000')
+
+    result = _convert(value)
+    if len(_RECENT) >= _RECENT_MAX:
+        _RECENT.clear()
+    _RECENT[value] = result
+    return result
+
+
+def from_xmltv(value):
+    """Return the epoch timestamp of a timestamp in the XMLTV format. Timestamps without an offset are in UTC."""
+    if len(value) < 14:
+        raise ValueError('Incomplete XMLTV timestamp: %s' % value)
+    day, time_of_day, offset = value[0:8], int(value[8:14]), value[14:]
+
+    # Programmes mostly share a few days and offsets, so we only compute those once
+    try:
+        epoch = _DAYS[day]
+    except KeyError:
+        epoch = _DAYS[day] = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]), 0, 0, 0))
+    try:
+        seconds = _OFFSET_SECONDS[offset]
+    except KeyError:
+        stripped = offset.strip()
+        seconds = 0
+        if stripped:
+            seconds = int(stripped[1:3]) * 3600 + int(stripped[3:5]) * 60
+            seconds = -seconds if stripped[0] == '-' else seconds
+        _OFFSET_SECONDS[offset] = seconds
+
+    return epoch + time_of_day // 10000 * 3600 + time_of_day // 100 % 100 * 60 + time_of_day % 100 - seconds
+
+
+def to_epoch(value):
+    """Return the epoch timestamp of a JSON-EPG timestamp, or None when it's missing or we can't parse it"""
+    if value is None:
+        return None
+    try:
+        return from_xmltv(to_xmltv(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _convert(value):
+    """Convert an ISO 8601 timestamp, and let dateutil handle all other formats"""
+    match = ISO_8601.match(value)
+    if match:
+        year, month, day, hour, minute, second, offset = match.groups()
+        suffix = _offset(offset)
+        if suffix is not None:
+            # Check that this is a valid date, dateutil would raise a ValueError otherwise
+            datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+            return year + month + day + hour + minute + second + suffix
+
+    return dateutil.parser.parse(value).strftime('%Y%m%d%H%M%S %z').rstrip()
+
+
+def _offset(offset):
+    """Return the XMLTV suffix for a UTC offset, or None if we leave it to dateutil"""
+    try:
+        return _OFFSETS[offset]
+    except KeyError:
+        pass
+
+    hours, minutes = offset[1:3], offset[-2:] if len(offset) > 3 else '00'
+    if int(hours) > 23 or int(minutes) > 59 or offset[0] == '-' and hours == minutes == '00':
+        return None
+    _OFFSETS[offset] = ' %s%s%s' % (offset[0], hours, minutes)
+    return _OFFSETS[offset]
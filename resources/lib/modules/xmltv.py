@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Serialize JSON-EPG programmes to XMLTV"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import json
+import os
+import re
+from xml.sax.saxutils import unescape
+
+from resources.lib.modules.jsonstream import JsonEpgReader
+from resources.lib.modules.timestamps import from_xmltv, to_xmltv
+from resources.lib.modules.xmltvstream import ENTITIES
+
+_ESCAPE = re.compile('[&<>"]')
+_ENTITIES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}
+
+# The first title of a RAW XMLTV programme
+_TITLE = re.compile(r'<title\b[^>]*>([^<]*)</title>')
+
+# IPTV Simple only supports `actor`, `director` and `writer`, so we need to narrow the credit types down
+CREDIT_TAGS = {
+    'actor': 'actor',
+    'director': 'director',
+    'writer': 'writer',
+    'adapter': 'writer',
+    'producer': 'director',
+    'composer': 'writer',
+    'editor': 'writer',
+    'presenter': 'actor',
+    'commentator': 'actor',
+    'guest': 'actor',
+}
+
+PROGRAMME_START = '<programme start="%s" stop="%s" channel="%s"%s>\n'
+CATCHUP_ID = ' catchup-id="%s"'
+TITLE = ' <title>%s</title>\n'
+SUBTITLE = ' <sub-title>%s</sub-title>\n'
+DESCRIPTION = ' <desc>%s</desc>\n'
+CREDITS_START = ' <credits>\n'
+CREDIT = '  <%s>%s</%s>\n'
+CREDIT_ROLE = '  <actor role="%s">%s</actor>\n'
+CREDITS_END = ' </credits>\n'
+DATE = ' <date>%s</date>\n'
+CATEGORY = ' <category>%s</category>\n'
+ICON = ' <icon src="%s"/>\n'
+EPISODE = ' <episode-num system="onscreen">%s</episode-num>\n'
+PROGRAMME_END = '</programme>\n'
+
+# The size of the write buffer of an XMLTV fragment
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# Kodi 18 can't play a programme, so we hide its stream in the title
+VOD_TITLE = '%s [COLOR green]•[/COLOR][COLOR vod="%s"][/COLOR]'
+
+
+def xml_encode(value):
+    """Escape a value for XML. Most values have nothing to escape, so we check that first."""
+    if value is None:
+        return ''
+    if '&' not in value and '<' not in value and '>' not in value and '"' not in value:
+        return value
+    return _ESCAPE.sub(lambda match: _ENTITIES[match.group()], value)
+
+
+class ProgrammeSerializer:
+    """Serialize the programmes of a JSON-EPG guide to XMLTV"""
+
+    def __init__(self, vod_titles=False, channels=None, since=None, until=None, index=None):
+        """Initialise the serializer. Set vod_titles for Kodi 18, which needs the stream of a programme in its title.
+        We drop the programmes of channels that are not in the lowercase channels, and the programmes that ended
+        before since or start after until. With a GuideIndex, we also drop the programmes it already has."""
+        self._vod_titles = vod_titles
+        self._channels = channels
+        self._since = since
+        self._until = until
+        self._index = index
+        self._channel = None
+        self._channel_xml = None
+        self._channel_key = None
+        self._channel_known = True
+        self.dropped = 0
+
+    def serialize(self, item, channel):
+        """Return the XMLTV of a programme, or None when we drop it"""
+        # The programmes of a channel usually follow each other
+        if channel != self._channel:
+            self._channel, self._channel_xml, self._channel_key = channel, xml_encode(channel), channel.lower()
+            self._channel_known = self._channels is None or self._channel_key in self._channels
+
+        if not self._channel_known:
+            self.dropped += 1
+            return None
+
+        get = item.get
+        start = to_xmltv(get('start'))
+        stop = to_xmltv(get('stop'))
+        if (self._since and from_xmltv(stop) < self._since) or (self._until and from_xmltv(start) > self._until):
+            self.dropped += 1
+            return None
+        title = get('title', '')
+        if self._index is not None and not self._index.add_programme(self._channel_key, from_xmltv(start), from_xmltv(stop), title):
+            return None
+
+        stream = get('stream')
+        if self._vod_titles and stream:
+            title = VOD_TITLE % (title, stream)
+
+        parts = [
+            PROGRAMME_START % (start, stop, self._channel_xml, CATCHUP_ID % xml_encode(stream) if stream else ''),
+            TITLE % xml_encode(title),
+        ]
+
+        if get('subtitle'):
+            parts.append(SUBTITLE % xml_encode(get('subtitle')))
+
+        if get('description'):
+            parts.append(DESCRIPTION % xml_encode(get('description')))
+
+        if get('credits'):
+            parts.append(CREDITS_START)
+            for credit in get('credits'):
+                credit_type = credit.get('type')
+                tag = CREDIT_TAGS.get(credit_type)
+                if tag is None:
+                    continue
+                if credit_type == 'actor' and credit.get('role'):
+                    parts.append(CREDIT_ROLE % (xml_encode(credit.get('role')), xml_encode(credit.get('name'))))
+                else:
+                    parts.append(CREDIT % (tag, xml_encode(credit.get('name')), tag))
+            parts.append(CREDITS_END)
+
+        if get('date'):
+            parts.append(DATE % xml_encode(get('date')))
+
+        genre = get('genre')
+        if genre:
+            if isinstance(genre, list):
+                parts.extend(CATEGORY % xml_encode(name) for name in genre)
+            else:
+                parts.append(CATEGORY % xml_encode(genre))
+
+        if get('image'):
+            parts.append(ICON % xml_encode(get('image')))
+
+        if get('episode'):
+            parts.append(EPISODE % xml_encode(get('episode')))
+
+        parts.append(PROGRAMME_END)
+        return ''.join(parts)
+
+    def passthrough(self, tag, attributes, element):  # pylint: disable=too-many-return-statements
+        """Return a channel or programme of RAW XMLTV data as-is, or None when we drop it"""
+        if tag == 'channel':
+            if self._index is not None and attributes.get('id') and not self._index.add_channel(attributes.get('id')):
+                return None
+            return element
+
+        if self._channels is not None and attributes.get('channel', '').lower() not in self._channels:
+            self.dropped += 1
+            return None
+
+        # We keep the programmes that we can't make sense of
+        try:
+            start, stop = from_xmltv(attributes['start']), from_xmltv(attributes['stop'])
+        except (KeyError, ValueError):
+            return element
+        if (self._since and stop < self._since) or (self._until and start > self._until):
+            self.dropped += 1
+            return None
+        if self._index is None:
+            return element
+        title = _TITLE.search(element)
+        if not self._index.add_programme(attributes.get('channel', '').lower(), start, stop, unescape(title.group(1), ENTITIES) if title else ''):
+            return None
+        return element
+
+
+class _FragmentIndex:
+    """Record the programmes of an XMLTV fragment, so the service can merge them with its GuideIndex later"""
+
+    def __init__(self):
+        """Initialise the index"""
+        self.programme = None
+
+    def add_programme(self, channel_id, start, stop, title=None):
+        """Remember the programme we serialize now"""
+        self.programme = [channel_id, start, stop, title]
+        return True
+
+
+def serialize_file(path, output_path, max_version=None, index_path=None, **options):
+    """Serialize the programmes of a JSON-EPG file to an XMLTV fragment in output_path. The options are passed to the
+    ProgrammeSerializer. With index_path, we write a JSON line with the channel, start, stop, title and size of every
+    programme. We return what happened instead of logging it, so we can store it with the programmes."""
+    result = dict(meta={}, count=0, dropped=0, failed=[], invalid=None)
+    fragment_index = _FragmentIndex() if index_path else None
+    serializer = ProgrammeSerializer(index=fragment_index, **options)
+    with open(path, 'rb') as fdesc, open(output_path, 'wb', WRITE_BUFFER_SIZE) as output, \
+            open(index_path or os.devnull, 'wb', WRITE_BUFFER_SIZE) as index:
+        reader = JsonEpgReader(fdesc)
+        result['meta'] = reader.meta
+        try:
+            for channel, item in reader:
+                # We can only check the version once we've seen it
+                if max_version and reader.meta.get('version', 1) > max_version:
+                    break
+                result['count'] += 1
+                try:
+                    programme = serializer.serialize(item, channel)
+                except Exception as exc:  # pylint: disable=broad-except
+                    result['failed'].append((item, str(exc)))
+                    continue
+                if programme is None:
+                    continue
+                programme = programme.encode('utf-8')
+                output.write(programme)
+                if fragment_index:
+                    index.write((json.dumps(fragment_index.programme + [len(programme)]) + '\n').encode('utf-8'))
+        except ValueError as exc:
+            result['invalid'] = str(exc)
+    result['dropped'] = serializer.dropped
+    return result
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Incremental XMLTV reader"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import codecs
+import re
+from xml.sax.saxutils import unescape
+
+CHUNK_SIZE = 64 * 1024
+
+# We skip elements that are larger than this, so malformed input can't make us buffer the whole document
+MAX_ELEMENT = 1024 * 1024
+
+ELEMENT = re.compile(r'<(channel|programme)\b')
+START_TAG = re.compile(r'<(channel|programme)\b((?:[^<>"\']|"[^"<]*"|\'[^\'<]*\')*?)(/?)>')
+ATTRIBUTE = re.compile(r'([\w:.-]+)\s*=\s*(["\'])(.*?)\2', flags=re.DOTALL)
+ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+
+class XmltvReader:
+    """Parse an XMLTV document while reading it, and yield a (tag, attributes, element) tuple for every channel and
+    programme. The element is the XML of the channel or programme as-is.
+
+    Only one element is buffered at a time, so the memory usage doesn't depend on the size of the guide. We skip the
+    elements that are malformed, and count them in `skipped`. Everything outside of the elements is ignored.
+    """
+
+    def __init__(self, fdesc, chunk_size=CHUNK_SIZE, max_element=MAX_ELEMENT):
+        """Initialise the reader on a binary file object"""
+        self.skipped = 0
+        self._fdesc = fdesc
+        self._chunk_size = chunk_size
+        self._max_element = max_element
+        self._decoder = None
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        """Yield all (tag, attributes, element) tuples of the document. Every iteration starts from the beginning."""
+        self._fdesc.seek(0)
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._buf, self._pos, self._eof = '', 0, False
+        self.skipped = 0
+
+        while True:
+            match = ELEMENT.search(self._buf, self._pos)
+            if not match:
+                # The end of the buffer could be the start of an element
+                self._pos = max(self._pos, len(self._buf) - len('<programme'))
+                if not self._fill():
+                    return
+                continue
+
+            start_tag, end, resume = self._element(match)
+            if resume is not None:
+                # The element is malformed, so we continue with the next one
+                self.skipped += 1
+                self._pos = resume
+                continue
+            if end is None:
+                # The element is incomplete, so we need more data, unless it's too large
+                if len(self._buf) - match.start() <= self._max_element and self._fill(match.start()):
+                    continue
+                self.skipped += 1
+                self._pos = match.end()
+                continue
+
+            attributes = dict((name, unescape(value, ENTITIES)) for name, _, value in ATTRIBUTE.findall(start_tag.group(2)))
+            self._pos = end
+            yield match.group(1), attributes, self._buf[match.start():end]
+
+    def channel_ids(self):
+        """Return the ids of the channels of the document. XMLTV has its channels before its programmes."""
+        ids = []
+        # Subclasses can do more when they are iterated, we only want the elements
+        for tag, attributes, _ in XmltvReader.__iter__(self):
+            if tag == 'programme':
+                break
+            if attributes.get('id'):
+                ids.append(attributes.get('id'))
+        return ids
+
+    def _element(self, match):
+        """Return the start tag and the end of the element that starts at match. The end is None when we don't have all
+        of the element yet. When the element is malformed, we also return the position to continue from."""
+        start_tag = START_TAG.match(self._buf, match.start())
+        if not start_tag:
+            # We could still be reading the start tag, unless there's another element already
+            following = ELEMENT.search(self._buf, match.end())
+            return None, None, following.start() if following else None
+        if start_tag.group(3):
+            return start_tag, start_tag.end(), None
+
+        end_tag = '</%s>' % match.group(1)
+        close = self._buf.find(end_tag, start_tag.end())
+
+        # An element that starts before the end tag means that this one was never closed
+        following = ELEMENT.search(self._buf, start_tag.end(), close if close != -1 else len(self._buf))
+        if following:
+            return start_tag, None, following.start()
+        if close == -1:
+            return start_tag, None, None
+        return start_tag, close + len(end_tag), None
+
+    def _fill(self, keep=None):
+        """Read the next chunk, and keep the buffer from keep on. Returns False when there is nothing left to read."""
+        if self._eof:
+            return False
+
+        # Drop the part that we already read
+        start = self._pos if keep is None else keep
+        if start:
+            self._buf = self._buf[start:]
+            self._pos = max(self._pos - start, 0)
+
+        chunk = self._fdesc.read(self._chunk_size)
+        self._eof = not chunk
+        self._buf += self._decoder.decode(chunk, final=self._eof)
+        return True
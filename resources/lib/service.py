@@ -9,8 +9,10 @@ import time
 from xbmc import Monitor
 
 from resources.lib import kodilogging, kodiutils
+from resources.lib.modules import sources
 from resources.lib.modules.addon import Addon
 from resources.lib.modules.iptvsimple import IptvSimple
+from resources.lib.modules.receiver import Receiver
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -40,14 +42,34 @@ class BackgroundService(Monitor):
             if self.waitForAbort(30):
                 break
 
+        Receiver.shutdown()
+        sources.close()
         _LOGGER.debug('Service stopped')
 
+    def onSettingsChanged(self):  # pylint: disable=invalid-name
+        """Callback when the settings have changed"""
+        # The settings can be changed in the settings dialog or by another process, so we read them again
+        kodiutils.invalidate_settings()
+
+    def onNotification(self, sender, method, data):  # pylint: disable=invalid-name,unused-argument
+        """Callback for Kodi notifications"""
+        # Look for add-ons that support IPTV Manager again when add-ons are installed, enabled, disabled or updated
+        if method.startswith('Addon.On'):
+            _LOGGER.debug('Received notification %s from %s, looking for add-ons again on the next refresh', method,
+                          sender)
+            Addon.invalidate_addons()
+
     @staticmethod
     def _is_refresh_required():
         """Returns if we should trigger an update based on the settings."""
         refresh_interval = kodiutils.get_setting_int('refresh_interval', 24) * 3600
         last_refreshed = kodiutils.get_setting_int('last_refreshed', 0)
-        return (last_refreshed + refresh_interval) <= time.time()
+        if (last_refreshed + refresh_interval) <= time.time():
+            return True
+
+        # The data of an add-on could expire sooner
+        next_refresh = kodiutils.get_setting_int('next_refresh', 0)
+        return 0 < next_refresh <= time.time()
 
 
 def run():
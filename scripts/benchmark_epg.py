@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare how many programmes per second the old and the new JSON-EPG to XMLTV serializer can handle.
+
+Run this from the root of the add-on with the test profile, like the unit tests:
+    KODI_HOME=$PWD/tests/home python scripts/benchmark_epg.py [programmes]
+"""
+
+# pylint: disable=missing-docstring,no-self-use,wrong-import-order,wrong-import-position,invalid-name
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from resources.lib import kodiutils  # noqa: E402
+from resources.lib.modules.timestamps import to_xmltv  # noqa: E402
+from resources.lib.modules.xmltv import ProgrammeSerializer  # noqa: E402
+
+
+class OldSerializer:
+    """The implementation with str.format, concatenation and an if/elif chain for the credits"""
+
+    @classmethod
+    def _construct_epg_program_xml(cls, item, channel):
+        """ Generate the XML for the EPG of a program. """
+        try:
+            start = to_xmltv(item.get('start'))
+            stop = to_xmltv(item.get('stop'))
+            title = item.get('title', '')
+
+            # Add an icon ourselves in Kodi 18
+            if kodiutils.kodi_version_major() < 19 and item.get('stream'):
+                # We use a clever way to hide the direct URI in the label so Kodi 18 can access the it
+                title = '%s [COLOR green]•[/COLOR][COLOR vod="%s"][/COLOR]' % (
+                    title, item.get('stream')
+                )
+
+            program = '<programme start="{start}" stop="{stop}" channel="{channel}"{vod}>\n'.format(
+                start=start,
+                stop=stop,
+                channel=cls._xml_encode(channel),
+                vod=' catchup-id="%s"' % cls._xml_encode(item.get('stream')) if item.get('stream') else '')
+
+            program += ' <title>{title}</title>\n'.format(
+                title=cls._xml_encode(title))
+
+            if item.get('subtitle'):
+                program += ' <sub-title>{subtitle}</sub-title>\n'.format(
+                    subtitle=cls._xml_encode(item.get('subtitle')))
+
+            if item.get('description'):
+                program += ' <desc>{description}</desc>\n'.format(
+                    description=cls._xml_encode(item.get('description')))
+
+            if item.get('credits'):
+                program += ' <credits>\n'
+                for credit in item.get('credits'):
+                    # IPTV Simple only supports `actor`, `director` and `writer`, so we need to narrow the options down.
+                    # actor -> actor (with optional role)
+                    # director -> director
+                    # writer -> writer
+                    # adapter -> writer
+                    # producer -> director
+                    # composer -> writer
+                    # editor -> writer
+                    # presenter -> actor
+                    # commentator -> actor
+                    # guest -> actor
+
+                    if credit.get('type') == 'actor':
+                        if credit.get('role'):
+                            program += '  <actor role="{role}">{name}</actor>\n'.format(role=cls._xml_encode(credit.get('role')),
+                                                                                        name=cls._xml_encode(credit.get('name')))
+                        else:
+                            program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'director':
+                        program += '  <director>{name}</director>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'writer':
+                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'adapter':
+                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'producer':
+                        program += '  <director>{name}</director>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'composer':
+                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'editor':
+                        program += '  <writer>{name}</writer>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'presenter':
+                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'commentator':
+                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
+                    elif credit.get('type') == 'guest':
+                        program += '  <actor>{name}</actor>\n'.format(name=cls._xml_encode(credit.get('name')))
+
+                program += ' </credits>\n'
+
+            if item.get('date'):
+                program += ' <date>{date}</date>\n'.format(
+                    date=cls._xml_encode(item.get('date')))
+
+            if item.get('genre'):
+                if isinstance(item.get('genre'), list):
+                    for genre in item.get('genre'):
+                        program += ' <category>{genre}</category>\n'.format(
+                            genre=cls._xml_encode(genre))
+                else:
+                    program += ' <category>{genre}</category>\n'.format(
+                        genre=cls._xml_encode(item.get('genre')))
+
+            if item.get('image'):
+                program += ' <icon src="{image}"/>\n'.format(
+                    image=cls._xml_encode(item.get('image')))
+
+            if item.get('episode'):
+                program += ' <episode-num system="onscreen">{episode}</episode-num>\n'.format(
+                    episode=cls._xml_encode(item.get('episode')))
+
+            program += '</programme>\n'
+            return program
+
+        except Exception as exc:  # pylint: disable=broad-except
+            # When we encounter an error, log an error, but don't error out for the other programs
+            print('Could not parse item: %s (%s)' % (item, exc))
+            return ''
+
+    @staticmethod
+    def _xml_encode(value):
+        """Quick and dirty encoding for XML values"""
+        if value is None:
+            return ''
+        return value \
+            .replace('&', '&amp;') \
+            .replace('<', '&lt;') \
+            .replace('>', '&gt;') \
+            .replace('"', '&quot;')
+
+
+def generate(count):
+    """Generate a guide with programmes like add-ons send them"""
+    programmes = []
+    for index in range(count):
+        programmes.append(('channel%d.example.com' % (index % 100), dict(
+            start='2021-01-%02dT%02d:%02d:00+01:00' % (1 + index // 2880 % 28, index // 60 % 24, index % 60),
+            stop='2021-01-%02dT%02d:%02d:30+01:00' % (1 + index // 2880 % 28, index // 60 % 24, index % 60),
+            title='Programme %d' % index,
+            description='The description of programme %d, with some "quotes" & an ampersand' % index,
+            subtitle='Episode %d' % index if index % 2 else None,
+            genre=['Documentary', 'Nature'] if index % 3 else 'News',
+            image='https://example.com/images/programme%d.jpg' % index,
+            stream='plugin://plugin.video.example/play/programme/%d' % index,
+            credits=[dict(type='actor', name='Actor %d' % index, role='Role'), dict(type='presenter', name='Presenter'),
+                     dict(type='director', name='Director'), dict(type='producer', name='Producer')],
+            episode='S01E%02d' % (index % 100),
+        )))
+    return programmes
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    programmes = generate(count)
+
+    # We take the best of a few runs, so other processes don't skew the result
+    old_duration = new_duration = float('inf')
+    serializer = ProgrammeSerializer(vod_titles=kodiutils.kodi_version_major() < 19)
+    for _ in range(3):
+        start = time.time()
+        old = [OldSerializer._construct_epg_program_xml(item, channel) for channel, item in programmes]  # pylint: disable=protected-access
+        old_duration = min(old_duration, time.time() - start)
+
+        start = time.time()
+        new = [serializer.serialize(item, channel) for channel, item in programmes]
+        new_duration = min(new_duration, time.time() - start)
+
+    print('old: %d programmes/s' % (count / old_duration))
+    print('new: %d programmes/s' % (count / new_duration))
+    print('The output is %s' % ('identical' if old == new else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    main()
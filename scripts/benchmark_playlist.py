@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the wall time and peak memory of writing a playlist with the old and the new implementation.
+
+Run this from the root of the add-on with the test profile, like the unit tests:
+    KODI_HOME=$PWD/tests/home python scripts/benchmark_playlist.py [channels]
+"""
+
+# pylint: disable=missing-docstring,no-self-use,wrong-import-order,wrong-import-position,invalid-name
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from resources.lib.modules.channel import Channel  # noqa: E402
+from resources.lib.modules.iptvsimple import IptvSimple  # noqa: E402
+
+
+def old_write_playlist(channels, playlist_path):
+    """The implementation that builds the playlist in one string"""
+    with open(playlist_path, 'wb') as fdesc:
+        m3u8_data = '#EXTM3U\n'
+
+        for addon in channels:
+            m3u8_data += '## {addon_name}\n'.format(**addon)
+
+            # RAW M3U8 data
+            if not isinstance(addon['channels'], list):
+                m3u8_data += addon['channels']
+                continue
+
+            # JSON-STREAMS format
+            for channel in addon['channels']:
+                m3u8_data += '#EXTINF:-1 tvg-name="{name}"'.format(**channel)
+                if channel.get('id'):
+                    m3u8_data += ' tvg-id="{id}"'.format(**channel)
+                if channel.get('logo'):
+                    m3u8_data += ' tvg-logo="{logo}"'.format(**channel)
+                if channel.get('preset'):
+                    m3u8_data += ' tvg-chno="{preset}"'.format(**channel)
+                if channel.get('group'):
+                    m3u8_data += ' group-title="{groups}"'.format(groups=';'.join(channel.get('group')))
+                if channel.get('radio'):
+                    m3u8_data += ' radio="true"'
+                m3u8_data += ' catchup="vod",{name}\n'.format(**channel)
+                if channel.get('kodiprops'):
+                    for key, value in channel.get('kodiprops').items():
+                        m3u8_data += '#KODIPROP:{key}={value}\n'.format(key=key, value=value)
+                m3u8_data += '{stream}\n\n'.format(**channel)
+
+        fdesc.write(m3u8_data.encode('utf-8'))
+
+
+def new_write_playlist(channels, playlist_path):
+    """The streaming implementation"""
+    import resources.lib.kodiutils
+    addon_profile = resources.lib.kodiutils.addon_profile
+    resources.lib.kodiutils.addon_profile = lambda: os.path.dirname(playlist_path)
+    try:
+        IptvSimple.write_playlist(channels)
+    finally:
+        resources.lib.kodiutils.addon_profile = addon_profile
+
+
+def generate(count):
+    """Generate a lineup of add-ons with channels in the JSON-STREAMS format"""
+    channels = []
+    for addon in range(10):
+        channels.append(dict(addon_id='plugin.video.addon%d' % addon, addon_name='Add-on %d' % addon, channels=[
+            dict(
+                id='channel%d.addon%d.com' % (channel, addon),
+                name='Channel %d' % channel,
+                preset=channel,
+                stream='plugin://plugin.video.addon%d/play/channel/%d' % (addon, channel),
+                logo='https://example.com/logos/addon%d/channel%d.png' % (addon, channel),
+                group={'Add-on %d' % addon},
+                kodiprops={'inputstream': 'inputstream.adaptive', 'inputstream.adaptive.manifest_type': 'mpd'},
+            ) for channel in range(count // 10)
+        ]))
+    return channels
+
+
+def from_dicts(channels):
+    """Return the lineup with the Channel objects that the add-on keeps since it fetched them"""
+    return [dict(addon, channels=[Channel.from_dict(channel) for channel in addon['channels']]) for addon in channels]
+
+
+def measure(func, channels, path):
+    """Return the wall time and the peak memory of writing the playlist"""
+    tracemalloc.start()
+    start = time.time()
+    func(channels, path)
+    duration = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    channels = generate(count)
+    output_dir = tempfile.mkdtemp()
+
+    results = {}
+    for name, func, lineup in (('old', old_write_playlist, channels), ('new', new_write_playlist, from_dicts(channels))):
+        path = os.path.join(output_dir, name, 'playlist.m3u8')
+        os.mkdir(os.path.dirname(path))
+        results[name] = measure(func, lineup, path)
+        print('%s: %.3f s, peak memory %.1f MB' % (name, results[name][0], results[name][1] / 1024 / 1024))
+
+    with open(os.path.join(output_dir, 'old', 'playlist.m3u8'), 'rb') as old, \
+            open(os.path.join(output_dir, 'new', 'playlist.m3u8'), 'rb') as new:
+        print('The playlists are %s' % ('identical' if old.read() == new.read() else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    main()
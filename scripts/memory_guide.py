@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare how much memory the old and the new representation of the channels and the guide index take.
+
+Run this from the root of the add-on with Python 3, since it needs tracemalloc:
+    python scripts/memory_guide.py [channels] [programmes]
+"""
+
+# pylint: disable=missing-docstring,wrong-import-position,invalid-name
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import bisect
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from resources.lib.modules.channel import Channel  # noqa: E402
+from resources.lib.modules.guideindex import GuideIndex  # noqa: E402
+
+
+class OldGuideIndex:
+    """The implementation with a list of starts and a dict of stops for every channel"""
+
+    def __init__(self):
+        self._programmes = {}
+
+    def add_programme(self, channel_id, start, stop):
+        entry = self._programmes.get(channel_id)
+        if entry is None:
+            entry = self._programmes[channel_id] = ([], {})
+        starts, stops = entry
+        if start in stops:
+            return False
+        pos = bisect.bisect_right(starts, start)
+        if pos and stops[starts[pos - 1]] >= stop:
+            return False
+        starts.insert(pos, start)
+        stops[start] = stop
+        return True
+
+
+def generate_channels(count):
+    """Generate channels like add-ons send them, after we parsed them"""
+    for index in range(count):
+        yield dict(
+            id='channel%d.example.com' % index,
+            name='Channel %d' % index,
+            stream='plugin://plugin.video.example/play/channel/%d' % index,
+            logo='https://example.com/logos/channel%d.png' % index,
+            preset=index + 1,
+            # Every channel has its own copy of these strings, like they come out of the JSON decoder
+            group=set(''.join(name) for name in ('Example IPTV Add-on', 'Belgium', 'News' if index % 2 else 'Sports')),
+            kodiprops={''.join('inputstream'): ''.join('inputstream.adaptive')},
+        )
+
+
+def measure(build):
+    """Return the memory that the result of build takes, and the result itself so it stays alive"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def fill(index, programmes):
+    for number in range(programmes):
+        index.add_programme('channel%d.example.com' % (number % 100), 1611396000 + number // 100 * 1800, 1611397800 + number // 100 * 1800)
+    return index
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    programmes = int(sys.argv[2]) if len(sys.argv) > 2 else 300000
+
+    old, _ = measure(lambda: list(generate_channels(channels)))
+    new, _ = measure(lambda: [Channel.from_dict(channel) for channel in generate_channels(channels)])
+    print('%d channels: old %.1f MB, new %.1f MB (%d%% less)' % (channels, old / 1e6, new / 1e6, 100 - 100 * new / old))
+
+    old, _ = measure(lambda: fill(OldGuideIndex(), programmes))
+    new, _ = measure(lambda: fill(GuideIndex(), programmes))
+    print('guide index of %d programmes: old %.1f MB, new %.1f MB (%d%% less)' % (programmes, old / 1e6, new / 1e6, 100 - 100 * new / old))
+
+
+if __name__ == '__main__':
+    main()
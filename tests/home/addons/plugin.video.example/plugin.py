@@ -19,9 +19,11 @@ except ImportError:  # Python 2
 class IPTVManager:
     """Interface to IPTV Manager"""
 
-    def __init__(self, port):
+    def __init__(self, port, token=None, compression=None):
         """Initialize IPTV Manager object"""
         self.port = port
+        self.token = token
+        self.compression = compression.split(',') if compression else []
 
     def via_socket(func):  # pylint: disable=no-self-argument
         """Send the output of the wrapped function to socket"""
@@ -33,7 +35,13 @@ class IPTVManager:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect(('127.0.0.1', self.port))
             try:
-                sock.send(json.dumps(func()).encode())
+                if self.token:
+                    sock.send(('token=%s\n' % self.token).encode())
+                data = json.dumps(func()).encode()
+                if 'zlib' in self.compression:
+                    import zlib
+                    data = zlib.compress(data)
+                sock.sendall(data)
             finally:
                 sock.close()
 
@@ -186,11 +194,11 @@ if __name__ == "__main__":
     print('Invoked plugin.video.example with route %s and query %s' % (route, query))
 
     if route == '/iptv/channels':
-        IPTVManager(int(query['port'])).send_channels()
+        IPTVManager(int(query['port']), query.get('token'), query.get('compression')).send_channels()
         exit()
 
     elif route == '/iptv/epg':
-        IPTVManager(int(query['port'])).send_epg()
+        IPTVManager(int(query['port']), query.get('token'), query.get('compression')).send_epg()
         exit()
 
     elif route.startswith('/play'):
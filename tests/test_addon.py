@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Tests for Addon"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from resources.lib import kodiutils
+from resources.lib.modules import health, sources
+from resources.lib.modules.addon import Addon
+from resources.lib.modules.health import Health
+from resources.lib.modules.payload import Payload
+
+try:  # Python 3
+    from urllib.parse import urljoin
+    from urllib.request import pathname2url
+except ImportError:  # Python 2
+    from urllib import pathname2url
+    from urlparse import urljoin
+
+
+class FakeAddon:
+    """A stand-in for an Addon that answers after a delay"""
+
+    def __init__(self, addon_id, delay, calls):
+        self.addon_id = addon_id
+        self.delay = delay
+        self.calls = calls
+        self.lock = threading.Lock()
+
+    def get_channels(self):
+        with self.lock:
+            self.calls.append((self.addon_id, 'channels'))
+        time.sleep(self.delay)
+        return [self.addon_id]
+
+    def get_epg(self):
+        with self.lock:
+            self.calls.append((self.addon_id, 'epg'))
+        time.sleep(self.delay)
+        return {self.addon_id: []}
+
+
+class AddonTest(unittest.TestCase):
+    """Addon Tests"""
+
+    def test_fetch_all(self):
+        """Test that all add-ons are queried simultaneously and the results are keyed on their position"""
+        calls = []
+        addons = [FakeAddon('addon.%d' % index, 0.2, calls) for index in range(5)]
+
+        start = time.time()
+        results = Addon._fetch_all(addons, workers=10)  # pylint: disable=protected-access
+        self.assertLess(time.time() - start, 1)
+
+        self.assertEqual(len(results), 10)
+        for index, addon in enumerate(addons):
+            self.assertEqual(results[(index, 'channels')], [addon.addon_id])
+            self.assertEqual(results[(index, 'epg')], {addon.addon_id: []})
+
+    def test_fetch_all_slowest_first(self):
+        """Test that the slowest add-ons are queried first"""
+        calls = []
+        addons = [FakeAddon('slow', 0.1, calls), FakeAddon('fast', 0, calls)]
+        Addon._fetch_all(addons, workers=1)  # pylint: disable=protected-access
+
+        # Now that we know their durations, the slow add-on should be started first
+        addons.reverse()
+        del calls[:]
+        Addon._fetch_all(addons, workers=1)  # pylint: disable=protected-access
+        self.assertEqual(calls[0][0], 'slow')
+        self.assertEqual(calls[-1][0], 'fast')
+
+    def test_expiry(self):
+        """Test that we only request data from an add-on when it has expired"""
+        addon = Addon('plugin.video.example', None, 'plugin://plugin.video.example/iptv/channels?test=expiry', None,
+                      refresh_intervals=dict(channels=3600))
+        requests = []
+
+        def get_data_from_addon(uri, path=None):  # pylint: disable=unused-argument
+            requests.append(uri)
+            payload = Payload()
+            payload.write(b'{"version": 1, "streams": [], "ttl": 7200}')
+            return payload
+
+        addon._get_data_from_addon = get_data_from_addon  # pylint: disable=protected-access
+        addon.expire()
+        try:
+            addon.get_channels()
+            addon.get_channels()
+            self.assertEqual(len(requests), 1)
+
+            # The TTL in the data takes precedence over the refresh interval of the add-on
+            self.assertAlmostEqual(Addon.next_expiry([addon]), time.time() + 7200, delta=5)
+
+            addon.expire()
+            addon.get_channels()
+            self.assertEqual(len(requests), 2)
+        finally:
+            addon.expire()
+
+    def test_expiry_failed(self):
+        """Test that we don't request data again right away when the add-on failed"""
+        addon = Addon('plugin.video.example', None, 'plugin://plugin.video.example/iptv/channels?test=expiry_failed', None)
+
+        def get_data_from_addon(uri, path=None):  # pylint: disable=unused-argument
+            raise socket.timeout('Timeout waiting for reply')
+
+        addon._get_data_from_addon = get_data_from_addon  # pylint: disable=protected-access
+        addon.expire()
+        try:
+            self.assertEqual(addon.get_channels(), [])
+            self.assertAlmostEqual(Addon.next_expiry([addon]), time.time() + health.RETRY_DELAY, delta=5)
+
+            # An expiry in the past is not a reason to refresh
+            kodiutils.update_cache(('addon', addon.addon_id, 'channels'), dict(expires=time.time() - 60))
+            self.assertEqual(Addon.next_expiry([addon]), 0)
+        finally:
+            addon.expire()
+            kodiutils.update_cache(('health', addon.addon_id), {})
+            Health.get(addon.addon_id).succeeded()
+
+    def test_expiry_unchanged(self):
+        """Test that we don't store the data of a source again when it didn't change"""
+        fdesc, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fdesc, 'wb') as handle:
+            handle.write(b'{"version": 1, "streams": []}')
+        addon = Addon('plugin.video.example', None, urljoin('file:', pathname2url(path)), None)
+        addon.expire()
+        try:
+            with patch('resources.lib.modules.sources._store', side_effect=sources._store) as store:  # pylint: disable=protected-access
+                for _ in range(3):
+                    addon.expire()
+                    addon.get_channels()
+            self.assertEqual(store.call_count, 1)
+        finally:
+            addon.expire()
+            os.remove(path)
+
+    def test_prioritize(self):
+        """Test that the preferred add-ons come first, in the order of the setting"""
+        addons = [FakeAddon('addon.%d' % index, 0, []) for index in range(4)]
+        kodiutils.set_setting('channel_priority', 'addon.3,addon.1,addon.unknown')
+        try:
+            prioritized = Addon._prioritize(addons)  # pylint: disable=protected-access
+        finally:
+            kodiutils.set_setting('channel_priority', '')
+        self.assertEqual([addon.addon_id for addon in prioritized], ['addon.3', 'addon.1', 'addon.0', 'addon.2'])
+
+    def test_epg_delta(self):
+        """Test that the EPG changes that an add-on sends are merged into the guide we have"""
+        addon = Addon('plugin.video.example', None, None, 'plugin://plugin.video.example/iptv/epg?test=delta',
+                      refresh_intervals=dict(epg=1))
+        replies = [
+            dict(version=2, cursor='1', epg={
+                'one': [dict(start='1', title='One'), dict(start='2', title='Two')],
+                'two': [dict(start='3', title='Three')],
+            }),
+            dict(version=2, cursor='2', delta=True, epg={
+                'one': [dict(start='2', title='Two (changed)'), dict(start='4', title='Four')],
+                'three': [dict(start='5', title='Five')],
+            }, removed={'two': ['3']}),
+            dict(version=2, cursor='3', delta=True, epg={}),
+        ]
+        cursors = []
+
+        def get_data_from_addon(uri, path=None, since=None):  # pylint: disable=unused-argument
+            cursors.append(since)
+            payload = Payload()
+            payload.write(json.dumps(replies[len(cursors) - 1]).encode('utf-8'))
+            return payload
+
+        addon._get_data_from_addon = get_data_from_addon  # pylint: disable=protected-access
+        addon.expire()
+        try:
+            self.assertEqual(len(list(addon.get_epg())), 3)
+
+            expected = [
+                ('one', dict(start='1', title='One')),
+                ('one', dict(start='2', title='Two (changed)')),
+                ('one', dict(start='4', title='Four')),
+                ('three', dict(start='5', title='Five')),
+            ]
+            self.assertEqual(list(addon.get_epg()), expected)
+            self.assertEqual(list(addon.get_epg()), expected)
+            self.assertEqual(cursors, [None, '1', '2'])
+        finally:
+            addon.expire()
+
+    def test_epg_delta_order(self):
+        """Test that we add the new programmes in start order, and only drop the programmes that ended before the
+        time window, when there is one"""
+        now = int(time.time())
+
+        def programme(hours, title):
+            return dict(start=now + hours * 3600 - 1800, stop=now + hours * 3600 + 1800, title=title)
+
+        def merge(past_hours):
+            addon = Addon('plugin.video.example', None, None, 'plugin://plugin.video.example/iptv/epg?test=delta_order',
+                          refresh_intervals=dict(epg=1))
+            replies = [
+                dict(version=2, cursor='1', epg={'one': [programme(-3, 'Ended'), programme(0, 'Now'), programme(2, 'Later')]}),
+                dict(version=2, cursor='2', delta=True, epg={'one': [programme(3, 'Last'), programme(1, 'Next'), programme(-5, 'Ended too')]}),
+            ]
+
+            def get_data_from_addon(uri, path=None, since=None):  # pylint: disable=unused-argument
+                payload = Payload()
+                payload.write(json.dumps(replies.pop(0)).encode('utf-8'))
+                return payload
+
+            addon._get_data_from_addon = get_data_from_addon  # pylint: disable=protected-access
+            addon.expire()
+            kodiutils.set_setting('epg_past_hours', past_hours)
+            try:
+                list(addon.get_epg())
+                return [item.get('title') for _, item in addon.get_epg()]
+            finally:
+                kodiutils.set_setting('epg_past_hours', '0')
+                addon.expire()
+
+        self.assertEqual(merge('2'), ['Now', 'Next', 'Later', 'Last'])
+        # We keep all programmes that have ended without a time window
+        self.assertEqual(merge('0'), ['Ended too', 'Ended', 'Now', 'Next', 'Later', 'Last'])
+
+    def test_retry(self):
+        """Test that we retry a request that failed"""
+        addon = Addon('plugin.video.example', None, 'plugin://plugin.video.example/iptv/channels?test=retry', None)
+        requests = []
+
+        def get_data_from_addon(uri, path=None):  # pylint: disable=unused-argument
+            requests.append(uri)
+            if len(requests) == 1:
+                raise Exception('Something went wrong')
+            payload = Payload()
+            payload.write(b'{"version": 1, "streams": []}')
+            return payload
+
+        addon._get_data_from_addon = get_data_from_addon  # pylint: disable=protected-access
+        addon.expire()
+        try:
+            self.assertEqual(addon.get_channels(), [])
+            self.assertEqual(len(requests), 2)
+        finally:
+            addon.expire()
+
+    def test_detect_iptv_addons(self):
+        """Test that we remember the add-ons we found, and only check an add-on again when its settings change"""
+        expected = ['plugin.video.example', 'plugin.video.example.three', 'plugin.video.example.two']
+        Addon.invalidate_addons()
+        self.assertEqual(sorted(addon.addon_id for addon in Addon.detect_iptv_addons()), expected)
+
+        calls = []
+        jsonrpc = kodiutils.jsonrpc
+
+        def fake_jsonrpc(*args, **kwargs):
+            calls.append(args or kwargs)
+            return [dict(id=idx, jsonrpc='2.0', result=dict(addon=dict(addonid=cmd['params']['addonid'], enabled=True)))
+                    for idx, cmd in enumerate(args)]
+
+        settings = kodiutils.get_addon_settings_path('plugin.video.example')
+        mtime = os.path.getmtime(settings)
+        kodiutils.jsonrpc = fake_jsonrpc
+        try:
+            addons = Addon.detect_iptv_addons()
+            self.assertEqual(sorted(addon.addon_id for addon in addons), expected)
+            self.assertEqual(calls, [])
+
+            os.utime(settings, (mtime + 10, mtime + 10))
+            addons = Addon.detect_iptv_addons()
+            self.assertEqual(sorted(addon.addon_id for addon in addons), expected)
+            self.assertEqual([cmd['params']['addonid'] for cmd in calls[0]], ['plugin.video.example'])
+        finally:
+            kodiutils.jsonrpc = jsonrpc
+            os.utime(settings, (mtime, mtime))
+            Addon.invalidate_addons()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Tests for the channels"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from resources.lib.modules.channel import Channel
+
+
+class ChannelTest(unittest.TestCase):
+    """Channel Tests"""
+
+    def test_from_dict(self):
+        """Test that we keep the fields of a JSON-STREAMS channel"""
+        channel = Channel.from_dict(dict(id='channel.example.com', name='Channel', stream='plugin://plugin.video.example/play/channel',
+                                         logo='/logo.png', preset=1, group={'News', 'Example'}, radio=True,
+                                         kodiprops={'inputstream': 'inputstream.adaptive'}))
+        self.assertEqual(channel.channel_id, 'channel.example.com')
+        self.assertEqual(channel.name, 'Channel')
+        self.assertEqual(channel.stream, 'plugin://plugin.video.example/play/channel')
+        self.assertEqual(channel.logo, '/logo.png')
+        self.assertEqual(channel.preset, 1)
+        self.assertEqual(channel.group, ('Example', 'News'))
+        self.assertTrue(channel.radio)
+        self.assertEqual(channel.kodiprops, (('inputstream', 'inputstream.adaptive'),))
+
+        channel = Channel.from_dict(dict(name='Channel', stream='plugin://plugin.video.example/play/channel'))
+        self.assertIsNone(channel.channel_id)
+        self.assertEqual(channel.group, ())
+        self.assertFalse(channel.radio)
+        self.assertEqual(channel.kodiprops, ())
+
+    def test_shared_strings(self):
+        """Test that channels share the strings that repeat"""
+        first = Channel('first.example.com', 'First', group=['Example' + str(1)])
+        second = Channel('second.example.com', 'Second', group=['Example' + str(1)])
+        self.assertIs(first.group[0], second.group[0])
+        with self.assertRaises(AttributeError):
+            first.extra = True  # pylint: disable=assigning-non-slot
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Tests for the functions"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import time
+import unittest
+
+from mock import call, patch
+
+from resources.lib import kodiutils
+from resources.lib.functions import run
+from resources.lib.modules.guidestore import GUIDE_STORE, GuideStore
+
+
+class FunctionsTest(unittest.TestCase):
+    """Functions Tests"""
+
+    def setUp(self):
+        self.now = int(time.time()) // 60 * 60
+        with GuideStore(os.path.join(kodiutils.get_cache_path(), GUIDE_STORE)) as store:
+            schedule = store.schedule_writer()
+            for hour in range(-2, 3):
+                schedule.add('channel.example.com', self.now + hour * 3600, self.now + (hour + 1) * 3600, 'Programme %d' % hour)
+            schedule.close()
+
+    def test_now_next(self):
+        """Test that we set the properties of what's on now and next"""
+        with patch('resources.lib.kodiutils.set_property') as set_property:
+            run([-1, 'now_next', 'Channel.example.com'])
+        properties = dict(call[0] for call in set_property.call_args_list)
+        self.assertEqual(properties['IPTVManager.NowNext.Channel'], 'Channel.example.com')
+        self.assertEqual(properties['IPTVManager.Now.Title'], 'Programme 0')
+        self.assertEqual(properties['IPTVManager.Next.Title'], 'Programme 1')
+        self.assertEqual(properties['IPTVManager.Next.Start'], time.strftime('%H:%M', time.localtime(self.now + 3600)))
+
+        result = kodiutils.get_cache(('query', 'now_next'))
+        self.assertEqual(result['now'], dict(start=self.now, stop=self.now + 3600, title='Programme 0'))
+
+        with patch('resources.lib.kodiutils.set_property') as set_property:
+            run([-1, 'now_next', 'unknown.example.com'])
+        self.assertEqual(dict(call[0] for call in set_property.call_args_list)['IPTVManager.Now.Title'], '')
+        self.assertIsNone(kodiutils.get_cache(('query', 'now_next'))['now'])
+
+    def test_programmes(self):
+        """Test that we look up the programmes of a time range"""
+        run([-1, 'programmes', 'channel.example.com', str(self.now - 1800), str(self.now + 3600)])
+        result = kodiutils.get_cache(('query', 'programmes'))
+        self.assertEqual([programme.get('title') for programme in result['programmes']], ['Programme -1', 'Programme 0'])
+
+    def test_arguments(self):
+        """Test that we refuse unknown functions, the wrong number of arguments, and timestamps we can't parse"""
+        for args in ([-1], [-1, 'unknown'], [-1, 'now_next'], [-1, 'now_next', 'channel.example.com', 'extra'],
+                     [-1, 'programmes', 'channel.example.com', 'yesterday'], [-1, 'programmes', 'channel.example.com', '', 'inf']):
+            with self.assertRaises(ValueError):
+                run(args)
+
+    def test_invalidate(self):
+        """Test that a script doesn't use the settings or add-on info it read in an interpreter that Kodi ran before"""
+        kodiutils.set_setting_int('epg_past_hours', 6)
+        kodiutils.addon_name('plugin.video.example')
+        try:
+            with patch.dict('resources.lib.kodiutils._SETTINGS', epg_past_hours='0'), \
+                    patch('resources.lib.kodiutils.get_addon', wraps=kodiutils.get_addon) as get_addon:
+                run([-1, 'programmes', 'channel.example.com'])
+                self.assertEqual(kodiutils.get_setting_int('epg_past_hours', 0), 6)
+                kodiutils.addon_name('plugin.video.example')
+                self.assertEqual(get_addon.call_args_list, [call('plugin.video.example')])
+        finally:
+            kodiutils.set_setting_int('epg_past_hours', 0)
+            kodiutils.invalidate_addon_info('plugin.video.example')
+
+
+if __name__ == '__main__':
+    unittest.main()
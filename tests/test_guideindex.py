@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Tests for the guide index"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from resources.lib.modules.guideindex import GuideIndex
+
+
+class GuideIndexTest(unittest.TestCase):
+    """Guide index Tests"""
+
+    def test_channels(self):
+        """Test that we only add a channel once, whatever its case"""
+        index = GuideIndex()
+        self.assertTrue(index.add_channel('channel1.com'))
+        self.assertTrue(index.add_channel('channel2.com'))
+        self.assertFalse(index.add_channel('Channel1.com'))
+        self.assertEqual(index.duplicate_channels, 1)
+
+    def test_programmes(self):
+        """Test that we drop duplicate programmes and programmes that are covered by another one"""
+        index = GuideIndex()
+        self.assertIsNone(index.report())
+        self.assertTrue(index.add_programme('channel1.com', 1000, 2000))
+        self.assertTrue(index.add_programme('channel1.com', 2000, 3000))
+        self.assertTrue(index.add_programme('channel2.com', 1000, 2000))
+        self.assertFalse(index.add_programme('channel1.com', 1000, 1500))
+        self.assertFalse(index.add_programme('channel1.com', 2500, 3000))
+        self.assertTrue(index.add_programme('channel1.com', 2500, 3500))
+        self.assertTrue(index.add_programme('channel1.com', 500, 1000))
+        self.assertEqual(index.duplicate_programmes, 1)
+        self.assertEqual(index.overlapping_programmes, 1)
+        self.assertEqual(index.report(), '0 duplicate channels, 1 duplicate programmes and 1 overlapping programmes')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Tests for the guide store"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from resources.lib.modules.guidestore import GuideStore
+
+
+class GuideStoreTest(unittest.TestCase):
+    """Guide Store Tests"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'guide.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_programmes(self):
+        """Test that we read the programmes of a JSON-EPG by channel and start, and only keep the first one at a start"""
+        with GuideStore(self.path) as store:
+            self.assertIsNone(store.get_outcome('first'))
+            store.add('first', dict(count=4), [
+                ('channel2.com', 1000, 2000, '2', b'<programme 2/>'),
+                ('channel1.com', 2000, 3000, '1b', b'<programme 1b/>'),
+                ('channel1.com', 1000, 2000, '1a', b'<programme 1a/>'),
+                ('channel1.com', 1000, 1500, 'Duplicate', b'<programme duplicate/>'),
+            ])
+            store.add('second', dict(count=1), [('channel1.com', 1000, 2000, 'Second', b'<programme second/>')])
+
+        with GuideStore(self.path) as store:
+            self.assertEqual(store.get_outcome('first'), dict(count=4))
+            self.assertEqual(list(store.programmes('first')), [
+                ('channel1.com', 1000, 2000, '1a', b'<programme 1a/>'),
+                ('channel1.com', 2000, 3000, '1b', b'<programme 1b/>'),
+                ('channel2.com', 1000, 2000, '2', b'<programme 2/>'),
+            ])
+            self.assertEqual([xml for _, _, _, _, xml in store.programmes('first', until=1500)], [b'<programme 1a/>', b'<programme 2/>'])
+
+            self.assertEqual(store.prune(2500), 3)
+            self.assertEqual([xml for _, _, _, _, xml in store.programmes('first')], [b'<programme 1b/>'])
+
+            # We don't have the programmes we removed when we need programmes that ended earlier
+            self.assertEqual(store.get_outcome('first', 2600), dict(count=4))
+            self.assertIsNone(store.get_outcome('first', 2000))
+            self.assertIsNone(store.get_outcome('first'))
+            store.add('first', dict(count=1), [('channel1.com', 1000, 2000, '1a', b'<programme 1a/>')])
+            self.assertEqual(store.get_outcome('first'), dict(count=1))
+
+            store.keep(['second'])
+            self.assertEqual(store.digests(), ['second'])
+            self.assertIsNone(store.get_outcome('first'))
+            self.assertEqual(list(store.programmes('first')), [])
+
+    def test_schedule(self):
+        """Test that we look up what's on from the schedule we wrote last"""
+        with GuideStore(self.path) as store:
+            schedule = store.schedule_writer()
+            for start in range(1000, 10000, 1000):
+                schedule.add('channel.com', start, start + 500 if start == 3000 else start + 1000, 'Programme %d' % start)
+            schedule.close()
+
+            self.assertEqual(store.get_now_next('Channel.com', 1500), ((1000, 2000, 'Programme 1000'), (2000, 3000, 'Programme 2000')))
+            self.assertEqual(store.get_now_next('channel.com', 3700), (None, (4000, 5000, 'Programme 4000')))
+            self.assertEqual(store.get_now_next('channel.com', 9500), ((9000, 10000, 'Programme 9000'), None))
+            self.assertEqual(store.get_now_next('unknown.com', 1500), (None, None))
+            self.assertEqual([title for _, _, title in store.get_schedule('channel.com', 1500, 4000)],
+                             ['Programme 1000', 'Programme 2000', 'Programme 3000'])
+
+            # We keep the schedule we have while we write a new one
+            schedule = store.schedule_writer()
+            schedule.add('channel.com', 1000, 2000, 'New')
+            self.assertEqual(store.get_now_next('channel.com', 1500)[0], (1000, 2000, 'Programme 1000'))
+            schedule.close()
+            self.assertEqual(store.get_now_next('channel.com', 1500), ((1000, 2000, 'New'), None))
+
+    def test_damaged(self):
+        """Test that we start over with a store that we can't open"""
+        with open(self.path, 'wb') as fdesc:
+            fdesc.write(b'This is not a database' * 100)
+        with GuideStore(self.path) as store:
+            self.assertEqual(store.digests(), [])
+
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA user_version = 0')
+        conn.execute('INSERT INTO sources (digest, outcome) VALUES (?, ?)', ('old', '{}'))
+        conn.commit()
+        conn.close()
+        with GuideStore(self.path) as store:
+            self.assertEqual(store.digests(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
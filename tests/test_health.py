@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tests for Health"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import unittest
+
+from resources.lib import kodiutils
+from resources.lib.modules import health
+from resources.lib.modules.health import Health
+
+
+class HealthTest(unittest.TestCase):
+    """Health Tests"""
+
+    def setUp(self):
+        kodiutils.update_cache(('health', 'test.health'), {})
+
+    def tearDown(self):
+        kodiutils.update_cache(('health', 'test.health'), {})
+
+    def test_timeout(self):
+        """Test that the timeout follows the latency of the add-on"""
+        addon = Health('test.health')
+        self.assertEqual(addon.timeout(), health.DEFAULT_TIMEOUT)
+
+        # A slow add-on gets more time after it timed out, until it connects
+        addon.timed_out()
+        self.assertEqual(addon.timeout(), 2 * health.DEFAULT_TIMEOUT)
+        addon.connected(12)
+        self.assertGreater(addon.timeout(), 12)
+
+        # A fast add-on gets less time
+        for _ in range(20):
+            addon.connected(0.5)
+        self.assertEqual(addon.timeout(), health.MIN_TIMEOUT)
+
+    def test_circuit_breaker(self):
+        """Test that we skip an add-on that keeps failing, and that we remember it after a restart"""
+        addon = Health('test.health')
+        for _ in range(health.FAILURE_THRESHOLD - 1):
+            addon.failed()
+        self.assertTrue(addon.available())
+        addon.failed()
+        self.assertFalse(addon.available())
+
+        # We still know after a restart
+        addon = Health('test.health')
+        self.assertFalse(addon.available())
+        self.assertAlmostEqual(addon._state['open_until'], time.time() + health.COOLDOWN, delta=5)  # pylint: disable=protected-access
+
+        # It's skipped for longer when it fails again
+        addon.failed()
+        self.assertAlmostEqual(addon._state['open_until'], time.time() + 2 * health.COOLDOWN, delta=5)  # pylint: disable=protected-access
+
+        addon.succeeded()
+        self.assertTrue(addon.available())
+
+
+if __name__ == '__main__':
+    unittest.main()
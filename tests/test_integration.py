@@ -7,6 +7,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import os
 import re
+import sys
+import threading
 import time
 import unittest
 
@@ -19,6 +21,45 @@ from resources.lib import kodiutils
 from resources.lib.modules.addon import Addon
 
 
+class PluginRunner:
+    """Runs plugin:// URIs one after the other. The Kodi stubs run them in threads that swap sys.argv, so a plugin
+    could see the arguments of the previous one when they overlap. Kodi runs every plugin in its own interpreter."""
+
+    def __init__(self):
+        self._execute_builtin = kodiutils.execute_builtin
+        self._thread = None
+
+    def execute_builtin(self, command, *args):
+        """Run a plugin in the background when the previous one has finished, and let the stubs do the rest"""
+        if command != 'RunPlugin':
+            self._execute_builtin(command, *args)
+            return
+        self.join()
+        self._thread = threading.Thread(target=self._run, args=(','.join(args),))
+        self._thread.start()
+
+    def join(self):
+        """Wait for the plugin that runs now"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _run(uri):
+        """Run the plugin of a plugin:// URI like Kodi does"""
+        addon_id, path, params = re.search(r'^plugin://([^?\s/]*)([^?\s]*)(\?.*)?', uri).groups()
+        entrypoint = os.path.join('tests', 'home', 'addons', addon_id, 'plugin.py')
+        argv = sys.argv
+        sys.argv = ['plugin://' + addon_id + path, '-1', params or '', 'resume:false']
+        try:
+            with open(entrypoint, 'rb') as fdesc:
+                exec(compile(fdesc.read(), entrypoint, 'exec'), dict(__name__='__main__', __file__=entrypoint))  # pylint: disable=exec-used
+        except SystemExit:
+            pass
+        finally:
+            sys.argv = argv
+
+
 class IntegrationTest(unittest.TestCase):
     """Integration Tests"""
 
@@ -33,8 +74,13 @@ class IntegrationTest(unittest.TestCase):
                 os.unlink(path)
 
         # Do the refresh
-        with patch('xbmcgui.DialogProgress.iscanceled', return_value=False):
-            Addon.refresh(True)
+        runner = PluginRunner()
+        with patch('xbmcgui.DialogProgress.iscanceled', return_value=False), \
+                patch('resources.lib.kodiutils.execute_builtin', side_effect=runner.execute_builtin):
+            try:
+                Addon.refresh(True)
+            finally:
+                runner.join()
 
         # Check that the files now exist
         for path in [m3u_path, epg_path]:
@@ -70,7 +116,6 @@ class IntegrationTest(unittest.TestCase):
         self.assertIsNotNone(xml.find('./channel[@id="raw1.com"]'))
 
         # Now, try playing something from the Guide
-        import sys
         sys.listitem = ListItem(label='Example Show [COLOR green]•[/COLOR][COLOR vod="plugin://plugin.video.example/play/something"][/COLOR]',
                                 path='pvr://guide/0006/2020-05-23 11:35:00.epg')
 
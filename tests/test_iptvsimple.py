@@ -5,9 +5,30 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
-from resources.lib.modules.iptvsimple import IptvSimple
+from mock import patch
+
+from resources.lib import kodiutils
+from resources.lib.modules.addon import Addon, JsonEpg
+from resources.lib.modules.channel import Channel
+from resources.lib.modules.guidestore import GUIDE_STORE, GuideStore
+from resources.lib.modules.iptvsimple import FRAGMENT_DIR, IPTV_SIMPLE_EPG, IPTV_SIMPLE_EPG_GZIP, IptvSimple
+from resources.lib.modules.payload import Payload
+from resources.lib.modules.xmltv import serialize_file
+
+
+def remove_guide_store():
+    """Forget the programmes we stored, so we serialize all JSON-EPG again"""
+    path = os.path.join(kodiutils.get_cache_path(), GUIDE_STORE)
+    if os.path.isfile(path):
+        os.remove(path)
 
 
 class IptvSimpleTest(unittest.TestCase):
@@ -24,6 +45,246 @@ class IptvSimpleTest(unittest.TestCase):
 
         self.assertFalse(IptvSimple.restart_required)
 
+    def test_write_unchanged(self):
+        """Test that we only replace the playlist and the EPG when they changed"""
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels=[
+            Channel('unchanged.example.com', 'Unchanged', 'plugin://plugin.video.example/play/unchanged', group={'Example', 'News', 'Belgium'}),
+        ])]
+        epg_list = [{'unchanged.example.com': [dict(start='2021-01-23T11:00:00Z', stop='2021-01-23T12:00:00Z', title='Unchanged')]}]
+        playlist_path = os.path.join(kodiutils.addon_profile(), 'playlist.m3u8')
+
+        self.assertTrue(IptvSimple.write_playlist(channels))
+        mtime = os.path.getmtime(playlist_path)
+        self.assertTrue(IptvSimple.write_epg(epg_list, channels))
+
+        self.assertFalse(IptvSimple.write_playlist(channels))
+        self.assertFalse(IptvSimple.write_epg(epg_list, channels))
+        self.assertEqual(os.path.getmtime(playlist_path), mtime)
+        self.assertEqual([name for name in os.listdir(kodiutils.addon_profile()) if name.endswith('.tmp')], [])
+
+        epg_list[0]['unchanged.example.com'][0]['title'] = 'Changed'
+        self.assertFalse(IptvSimple.write_playlist(channels))
+        self.assertTrue(IptvSimple.write_epg(epg_list, channels))
+
+        with open(playlist_path, 'rb') as fdesc:
+            self.assertIn(b'group-title="Belgium;Example;News"', fdesc.read())
+
+    def test_write_epg_fragments(self):
+        """Test that we write the same EPG from the programmes we stored as when we serialize the JSON-EPG"""
+        directory = tempfile.mkdtemp()
+        paths = []
+        for index in range(3):
+            paths.append(os.path.join(directory, 'epg%d.json' % index))
+            with open(paths[-1], 'wb') as fdesc:
+                fdesc.write(json.dumps(dict(version=1, epg={
+                    'channel%d.example.com' % index: [
+                        dict(start=1611396000 + number * 3600, stop=1611399600 + number * 3600, title='Programme %d & co' % number)
+                        for number in range(100)
+                    ],
+                    'orphan.example.com': [dict(start='2021-01-23T11:00:00Z', stop='2021-01-23T12:00:00Z', title='Orphan')],
+                })).encode('utf-8'))
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels=[
+            Channel('channel%d.example.com' % index, 'Channel %d' % index) for index in range(3)
+        ] + [Channel('Dict.Example.com', 'Dict')])]
+        addon = Addon('plugin.video.example', None, None, 'plugin://plugin.video.example/iptv/epg?test=fragments')
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+
+        outputs = []
+        remove_guide_store()
+        try:
+            for _ in range(2):
+                epg_list = [JsonEpg(addon, Payload.from_file(paths[0])),
+                            '<channel id="raw"/><programme start="20210123110000 +0100" stop="20210123120000 +0100" channel="raw"/>',
+                            JsonEpg(addon, Payload.from_file(paths[1])),
+                            {'dict.example.com': [dict(start='2021-01-23T11:00:00Z', stop='2021-01-23T12:00:00Z', title='Dict')]},
+                            JsonEpg(addon, Payload.from_file(paths[2]))]
+                IptvSimple.write_epg(epg_list, channels)
+                with open(epg_path, 'rb') as fdesc:
+                    outputs.append(fdesc.read())
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0].count(b'<programme '), 302)
+        self.assertNotIn(b'Orphan', outputs[0])
+        self.assertLess(outputs[0].index(b'Programme 99 &amp; co</title>\n</programme>\n<channel id="raw"/>\n<programme start="20210123110000 +0100" '
+                                         b'stop="20210123120000 +0100" channel="raw"/>'), outputs[0].index(b'channel="channel2.example.com"'))
+        self.assertEqual([name for name in os.listdir(kodiutils.addon_profile()) if name.endswith('.tmp')], [])
+
+    def test_write_epg_stored(self):
+        """Test that we only serialize the JSON-EPG that changed, and write the programmes we stored for the others"""
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, 'epg%d.json' % index) for index in range(3)]
+
+        def write_json(index, title):
+            with open(paths[index], 'wb') as fdesc:
+                fdesc.write(json.dumps(dict(version=1, epg={'channel%d.example.com' % index: [
+                    dict(start=1611396000 + number * 3600, stop=1611399600 + number * 3600, title='%s %d' % (title, number))
+                    for number in range(100)
+                ]})).encode('utf-8'))
+
+        def write_epg():
+            addon = Addon('plugin.video.example', None, None, 'plugin://plugin.video.example/iptv/epg?test=fragments')
+            with patch('resources.lib.modules.iptvsimple.serialize_file', wraps=serialize_file) as serialize:
+                IptvSimple.write_epg([JsonEpg(addon, Payload.from_file(path)) for path in paths], channels)
+            with open(epg_path, 'rb') as fdesc:
+                return serialize.call_count, fdesc.read()
+
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels=[
+            Channel('channel%d.example.com' % index, 'Channel %d' % index) for index in range(3)
+        ])]
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+        remove_guide_store()
+
+        try:
+            for index in range(3):
+                write_json(index, 'Programme')
+            self.assertEqual(write_epg()[0], 3)
+            self.assertEqual(write_epg()[0], 0)
+
+            write_json(1, 'Changed')
+            calls, data = write_epg()
+            self.assertEqual(calls, 1)
+            self.assertEqual(os.listdir(os.path.join(kodiutils.get_cache_path(), FRAGMENT_DIR)), [])
+            with GuideStore(os.path.join(kodiutils.get_cache_path(), GUIDE_STORE)) as store:
+                self.assertEqual([len(list(store.programmes(digest))) for digest in sorted(store.digests())], [100, 100, 100])
+
+            # The EPG is the same as one we write from scratch
+            remove_guide_store()
+            self.assertEqual(write_epg(), (3, data))
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertIn(b'<title>Changed 99</title>', data)
+        self.assertLess(data.index(b'<title>Changed 99</title>'), data.index(b'channel="channel2.example.com"'))
+        self.assertEqual(data.count(b'<programme '), 300)
+
+    def test_write_epg_stored_window(self):
+        """Test that we get the programmes we removed from the guide store back when the time window gets wider"""
+        now = int(time.time())
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'epg.json')
+        with open(path, 'wb') as fdesc:
+            fdesc.write(json.dumps(dict(version=1, epg={'channel.example.com': [
+                dict(start=start, stop=start + 3600, title='Programme %d' % ((start - now) // 3600))
+                for start in range(now - 48 * 3600, now + 3600, 3600)
+            ]})).encode('utf-8'))
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels=[Channel('channel.example.com', 'Channel')])]
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+        remove_guide_store()
+
+        def write_epg(past_hours):
+            addon = Addon('plugin.video.example', None, None, 'plugin://plugin.video.example/iptv/epg?test=window')
+            kodiutils.set_setting('epg_past_hours', past_hours)
+            try:
+                IptvSimple.write_epg([JsonEpg(addon, Payload.from_file(path))], channels)
+            finally:
+                kodiutils.set_setting('epg_past_hours', '0')
+            with open(epg_path, 'rb') as fdesc:
+                return fdesc.read().count(b'<programme ')
+
+        try:
+            self.assertEqual(write_epg('2'), 3)
+            self.assertEqual(write_epg('2'), 3)
+            self.assertEqual(write_epg('6'), 7)
+            self.assertEqual(write_epg('0'), 49)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_write_epg_compressed(self):
+        """Test that we can write the EPG compressed with gzip, and switch back"""
+        epg_list = [{'channel.example.com': [
+            dict(start=1611396000 + number * 3600, stop=1611399600 + number * 3600, title='Programme %d' % number) for number in range(1000)
+        ]}]
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels=[Channel('channel.example.com', 'Channel')])]
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+        gzip_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG_GZIP)
+
+        IptvSimple.write_epg(epg_list, channels)
+        with open(epg_path, 'rb') as fdesc:
+            expected = fdesc.read()
+
+        kodiutils.set_setting('epg_compression', '6')
+        try:
+            IptvSimple.write_epg(epg_list, channels)
+        finally:
+            kodiutils.set_setting('epg_compression', '0')
+        self.assertFalse(os.path.exists(epg_path))
+        self.assertLess(os.path.getsize(gzip_path) * 10, len(expected))
+        with gzip.open(gzip_path, 'rb') as fdesc:
+            self.assertEqual(fdesc.read(), expected)
+
+        IptvSimple.write_epg(epg_list, channels)
+        self.assertFalse(os.path.exists(gzip_path))
+        self.assertTrue(os.path.exists(epg_path))
+
+    def test_write_epg_deduplicated(self):
+        """Test that the first add-on wins when add-ons have the same channels and programmes"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'epg.json')
+        with open(path, 'wb') as fdesc:
+            fdesc.write(json.dumps(dict(version=1, epg={'shared.example.com': [
+                dict(start='2021-01-23T11:00:00+01:00', stop='2021-01-23T12:00:00+01:00', title='Second'),
+                dict(start='2021-01-23T12:00:00+01:00', stop='2021-01-23T13:00:00+01:00', title='Second only'),
+            ]})).encode('utf-8'))
+        channels = [
+            dict(addon_id='plugin.video.first', addon_name='First', channels=[Channel('shared.example.com', 'First')]),
+            dict(addon_id='plugin.video.second', addon_name='Second', channels=[Channel('Shared.example.com', 'Second')]),
+            dict(addon_id='plugin.video.third', addon_name='Third', channels='#EXTM3U\n#EXTINF:-1 tvg-id="shared.example.com",Third\n'),
+        ]
+        addon = Addon('plugin.video.second', None, None, 'plugin://plugin.video.second/iptv/epg?test=deduplicated')
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+
+        outputs = []
+        remove_guide_store()
+        try:
+            for _ in range(2):
+                epg_list = [
+                    {'shared.example.com': [dict(start='2021-01-23T10:00:00Z', stop='2021-01-23T11:00:00Z', title='First')]},
+                    JsonEpg(addon, Payload.from_file(path)),
+                    '<channel id="shared.example.com"><display-name>Third</display-name></channel>\n'
+                    '<programme start="20210123120000 +0100" stop="20210123130000 +0100" channel="shared.example.com">'
+                    '<title>Third</title></programme>',
+                ]
+                IptvSimple.write_epg(epg_list, channels)
+                with open(epg_path, 'rb') as fdesc:
+                    outputs.append(fdesc.read())
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0].count(b'<channel '), 1)
+        self.assertIn(b'<display-name>First</display-name>', outputs[0])
+        self.assertEqual(outputs[0].count(b'<programme '), 2)
+        self.assertIn(b'<title>First</title>', outputs[0])
+        self.assertIn(b'<title>Second only</title>', outputs[0])
+
+    def test_write_epg_pruned(self):
+        """Test that we drop the programmes of unknown channels, and the programmes outside the time window"""
+        now = int(time.time())
+        epg_list = [{'channel.example.com': [
+            dict(start=start, stop=start + 3600, title='Programme %d' % ((start - now) // 3600))
+            for start in range(now - 100 * 3600, now + 100 * 3600, 3600)
+        ], 'unknown.example.com': [dict(start=now, stop=now + 3600, title='Unknown')]}]
+        channels = [dict(addon_id='plugin.video.example', addon_name='Example', channels='#EXTM3U\n#EXTINF:-1 tvg-id="channel.example.com",Channel\n')]
+        epg_path = os.path.join(kodiutils.addon_profile(), IPTV_SIMPLE_EPG)
+
+        kodiutils.set_setting('epg_past_hours', '6')
+        kodiutils.set_setting('epg_future_days', '1')
+        try:
+            IptvSimple.write_epg(epg_list, channels)
+        finally:
+            kodiutils.set_setting('epg_past_hours', '0')
+            kodiutils.set_setting('epg_future_days', '0')
+        with open(epg_path, 'rb') as fdesc:
+            data = fdesc.read()
+
+        self.assertNotIn(b'Unknown', data)
+        self.assertIn(b'<title>Programme -6</title>', data)
+        self.assertNotIn(b'<title>Programme -7</title>', data)
+        self.assertIn(b'<title>Programme 24</title>', data)
+        self.assertNotIn(b'<title>Programme 25</title>', data)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Tests for the incremental JSON-EPG parser"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import json
+import unittest
+
+from resources.lib.modules.jsonstream import JsonEpgReader, JsonEpgWriter, JsonStringReader
+
+EPG = {
+    'version': 1,
+    'epg': {
+        'één.be': [
+            dict(start='2021-01-23T11:42:55+01:00', stop='2021-01-23T12:12:55+01:00', title='Show with a [ and a "quote"',
+                 credits=[dict(type='actor', name='Kit Harington', role='Jon Snow')], episode=12345678),
+            dict(start='2021-01-23T12:12:55+01:00', stop='2021-01-23T13:12:55+01:00', title='Ünïcödé € show', image=None),
+        ],
+        'empty.com': [],
+        'channel1.com': [
+            dict(start='2021-01-23T11:42:55', stop='2021-01-23T12:12:55', title='Show 3', genre=['Quiz', 'News']),
+        ],
+    },
+}
+
+
+class JsonStreamTest(unittest.TestCase):
+    """Incremental JSON-EPG parser Tests"""
+
+    def _expected(self, epg):
+        return [(channel, programme) for channel, programmes in epg['epg'].items() for programme in programmes]
+
+    def test_small_chunks(self):
+        """Test that we get the same data as json.loads when we read one byte at a time"""
+        data = json.dumps(EPG, indent=2).encode('utf-8')
+        for chunk_size in (1, 3, 7, 1024):
+            reader = JsonEpgReader(io.BytesIO(data), chunk_size=chunk_size)
+            self.assertEqual(list(reader), self._expected(EPG))
+            self.assertEqual(reader.meta, dict(version=1))
+
+    def test_meta_after_epg(self):
+        """Test that other keys are available after the EPG"""
+        data = '{"epg": {"a": [{"title": "x"}]}, "version": 2, "extra": [1, {"b": 2}]}'.encode('utf-8')
+        reader = JsonEpgReader(io.BytesIO(data), chunk_size=2)
+        self.assertEqual(list(reader), [('a', dict(title='x'))])
+        self.assertEqual(reader.meta, dict(version=2, extra=[1, dict(b=2)]))
+
+    def test_empty(self):
+        """Test documents without programmes"""
+        for data in ('{}', '{"version": 1}', '{"version": 1, "epg": {}}'):
+            self.assertEqual(list(JsonEpgReader(io.BytesIO(data.encode('utf-8')))), [])
+
+    def test_malformed(self):
+        """Test that a malformed or truncated document raises a ValueError"""
+        for data in ('{"epg": {"a": [{"title": "x"}', '{"epg": {"a": [{"title": "x"} {}]}}', '[]'):
+            with self.assertRaises(ValueError):
+                list(JsonEpgReader(io.BytesIO(data.encode('utf-8')), chunk_size=4))
+
+    def test_writer(self):
+        """Test that we can write a JSON-EPG document one programme at a time"""
+        fdesc = io.BytesIO()
+        writer = JsonEpgWriter(fdesc, dict(version=1))
+        for channel, programme in self._expected(EPG):
+            writer.write(channel, programme)
+        writer.close()
+
+        expected = dict(version=1, epg=dict((channel, programmes) for channel, programmes in EPG['epg'].items() if programmes))
+        self.assertEqual(json.loads(fdesc.getvalue().decode('utf-8')), expected)
+
+        fdesc = io.BytesIO()
+        JsonEpgWriter(fdesc, {}).close()
+        self.assertEqual(json.loads(fdesc.getvalue().decode('utf-8')), dict(epg={}))
+
+    def test_string_reader(self):
+        """Test that we can read a JSON string, also when its escape sequences are split over chunks"""
+        text = '<tv>\n <title>Show with a "quote", a \\ and ünïcödé 😀</title>\t\x01\n</tv>' * 10
+        text += '\\\\"' * 10 + '\\' * 100
+        for data in (json.dumps(text), json.dumps(text, ensure_ascii=False), ' %s\n' % json.dumps(text)):
+            for chunk_size in (1, 5, 64 * 1024):
+                reader = JsonStringReader(io.BytesIO(data.encode('utf-8')), chunk_size=chunk_size)
+                for _ in range(2):
+                    reader.seek(0)
+                    self.assertEqual(b''.join(iter(reader.read, b'')).decode('utf-8'), text)
+
+        for data in ('{"epg": {}}', '"truncated', ''):
+            with self.assertRaises(ValueError):
+                list(iter(JsonStringReader(io.BytesIO(data.encode('utf-8'))).read, b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
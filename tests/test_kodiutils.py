@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for the Kodi utilities"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from mock import MagicMock, patch
+
+from resources.lib import kodiutils
+
+
+class KodiUtilsTest(unittest.TestCase):
+    """Kodi utilities Tests"""
+
+    def test_addon_info(self):
+        """Test that we look up the info of an add-on id once, until we invalidate it"""
+        addon = MagicMock()
+        addon.getAddonInfo.side_effect = lambda key: 'Example' if key == 'name' else 'special://profile/addon_data/plugin.video.example/'
+        with patch('resources.lib.kodiutils.get_addon', return_value=addon) as get_addon:
+            for _ in range(3):
+                self.assertEqual(kodiutils.addon_name('plugin.video.example'), 'Example')
+            self.assertEqual(addon.getAddonInfo.call_count, 1)
+            kodiutils.addon_profile('plugin.video.example')
+            kodiutils.addon_profile('plugin.video.example')
+            self.assertEqual(addon.getAddonInfo.call_count, 2)
+
+            kodiutils.invalidate_addon_info('plugin.video.example')
+            self.assertEqual(kodiutils.addon_name('plugin.video.example'), 'Example')
+            self.assertEqual(addon.getAddonInfo.call_count, 3)
+            self.assertEqual(get_addon.call_count, 3)
+
+        # The info of an xbmcaddon.Addon is looked up every time
+        self.assertEqual(kodiutils.addon_name(addon), 'Example')
+        self.assertEqual(addon.getAddonInfo.call_count, 4)
+
+    def test_settings(self):
+        """Test that we read a setting once, until we write it or the settings change"""
+        kodiutils.invalidate_settings()
+        with patch.object(kodiutils.ADDON, 'getSetting', wraps=kodiutils.ADDON.getSetting) as get_setting:
+            for _ in range(3):
+                self.assertEqual(kodiutils.get_setting_int('epg_past_hours', 0), 0)
+            self.assertEqual(get_setting.call_count, 1)
+
+            try:
+                kodiutils.set_setting_int('epg_past_hours', 6)
+                self.assertEqual(kodiutils.get_setting_int('epg_past_hours', 0), 6)
+                kodiutils.set_setting_bool('debug_logging', True)
+                self.assertTrue(kodiutils.get_setting_bool('debug_logging'))
+                self.assertEqual(get_setting.call_count, 1)
+
+                kodiutils.invalidate_settings()
+                self.assertEqual(kodiutils.get_setting_int('epg_past_hours', 0), 6)
+                self.assertEqual(get_setting.call_count, 2)
+            finally:
+                kodiutils.set_setting_int('epg_past_hours', 0)
+                kodiutils.set_setting_bool('debug_logging', False)
+
+    def test_kodi_version(self):
+        """Test that we only ask Kodi its version once"""
+        kodiutils.kodi_version_major()
+        with patch('xbmc.getInfoLabel') as get_info_label:
+            self.assertTrue(kodiutils.kodi_version_major() >= 18)
+            get_info_label.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
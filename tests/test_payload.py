@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Tests for Payload"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gzip
+import io
+import unittest
+import zlib
+
+from resources.lib.modules.payload import receive
+
+
+class FakeConnection:
+    """A connection that returns its data in fixed-size chunks"""
+
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def recv(self, bufsize):
+        chunk, self.data = self.data[:min(bufsize, self.chunk_size)], self.data[min(bufsize, self.chunk_size):]
+        return chunk
+
+
+class PayloadTest(unittest.TestCase):
+    """Payload Tests"""
+
+    def test_multibyte_boundaries(self):
+        """Test that characters that are split over multiple chunks are decoded correctly"""
+        text = 'één € 4 + 4 > 6 ' * 1000
+        payload = receive(FakeConnection(text.encode('utf-8'), 7), recv_size=5)
+        with payload:
+            self.assertFalse(payload.spilled)
+            self.assertEqual(payload.read_text(chunk_size=3), text)
+
+    def test_spill_to_disk(self):
+        """Test that large payloads are spilled to disk"""
+        text = '{"version": 1, "epg": {"één.be": []}}' * 1000
+        payload = receive(FakeConnection(text.encode('utf-8'), 4096), head=b'', max_memory=1024)
+        with payload:
+            self.assertTrue(payload.spilled)
+            self.assertEqual(payload.size, len(text.encode('utf-8')))
+            self.assertEqual(payload.read_text(), text)
+
+    def test_compressed(self):
+        """Test that gzip and zlib compressed data is decompressed, also when it arrives in small chunks"""
+        text = '{"version": 1, "epg": {"één.be": []}}' * 1000
+        gzipped = io.BytesIO()
+        with gzip.GzipFile(fileobj=gzipped, mode='wb') as gzfile:
+            gzfile.write(text.encode('utf-8'))
+
+        for data in (gzipped.getvalue(), zlib.compress(text.encode('utf-8'))):
+            with receive(FakeConnection(data[1:], 1), head=data[:1], recv_size=3) as payload:
+                self.assertEqual(payload.size, len(text.encode('utf-8')))
+                self.assertEqual(payload.read_text(), text)
+
+    def test_uncompressed_like(self):
+        """Test that data that only looks like a zlib header is not decompressed"""
+        for text in ('x', 'xml', '#EXTM3U'):
+            with receive(FakeConnection(text.encode('utf-8'), 1)) as payload:
+                self.assertEqual(payload.read_text(), text)
+
+    def test_compressed_incomplete(self):
+        """Test that truncated compressed data raises an exception"""
+        data = zlib.compress(b'{"version": 1, "streams": []}')
+        with self.assertRaises(Exception):
+            receive(FakeConnection(data[:-5], 1024))
+
+
+if __name__ == '__main__':
+    unittest.main()
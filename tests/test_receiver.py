@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Tests for Receiver"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import socket
+import threading
+import time
+import unittest
+
+from resources.lib.modules.receiver import Receiver
+
+
+def send(port, data, token=None, delay=0):
+    """Connect to the receiver and send data like an add-on would"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(('127.0.0.1', port))
+    try:
+        if token:
+            sock.send(('token=%s\n' % token).encode())
+        time.sleep(delay)
+        sock.send(data)
+    finally:
+        sock.close()
+
+
+def read(request, timeout=5):
+    """Read the full reply of a request"""
+    conn, buf = request.wait(timeout)
+    while True:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        buf += chunk
+    conn.close()
+    return buf
+
+
+class ReceiverTest(unittest.TestCase):
+    """Receiver Tests"""
+
+    def setUp(self):
+        self.receiver = Receiver.instance()
+
+    def tearDown(self):
+        Receiver.shutdown()
+
+    def test_token_routing(self):
+        """Test that replies are routed to the request with the same token"""
+        Receiver.token_aware.update(['addon.one', 'addon.two'])
+        with self.receiver.request('addon.one') as one, self.receiver.request('addon.two') as two:
+            self.assertEqual(one.port, two.port)
+            self.assertNotEqual(one.token, two.token)
+
+            # The second add-on answers first
+            threading.Thread(target=send, args=(two.port, b'two', two.token)).start()
+            threading.Thread(target=send, args=(one.port, b'one', one.token, .5)).start()
+
+            self.assertEqual(read(one), b'one')
+            self.assertEqual(read(two), b'two')
+
+    def test_legacy_routing(self):
+        """Test that add-ons without token support reply on a port of their own, and can all wait at the same time"""
+        Receiver.token_aware.difference_update(['addon.legacy1', 'addon.legacy2'])
+        with self.receiver.request('addon.legacy1') as one, self.receiver.request('addon.legacy2') as two:
+            self.assertNotEqual(one.port, self.receiver.port)
+            self.assertNotEqual(one.port, two.port)
+
+            # The second add-on answers first, while the first one is still waiting
+            threading.Thread(target=send, args=(two.port, b'two', None, .2)).start()
+            threading.Thread(target=send, args=(one.port, b'{"version": 1}', None, .5)).start()
+
+            start = time.time()
+            results = {}
+            threads = [threading.Thread(target=lambda request=request: results.update({request.addon_id: read(request)}))
+                       for request in (one, two)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(results, {'addon.legacy1': b'{"version": 1}', 'addon.legacy2': b'two'})
+
+    def test_token_discovery(self):
+        """Test that we route the replies of an add-on on its token once it sent us one on its own port"""
+        Receiver.token_aware.discard('addon.discovery')
+        with self.receiver.request('addon.discovery') as request:
+            threading.Thread(target=send, args=(request.port, b'data', request.token)).start()
+            self.assertEqual(read(request), b'data')
+        self.assertIn('addon.discovery', Receiver.token_aware)
+
+        with self.receiver.request('addon.discovery') as request:
+            self.assertEqual(request.port, self.receiver.port)
+
+    def test_partial_header(self):
+        """Test that we wait for the rest of a token header, and drop a connection that closes before it's complete"""
+        Receiver.token_aware.add('addon.partial')
+        with self.receiver.request('addon.partial') as request:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(('127.0.0.1', request.port))
+            sock.send(b'tok')
+            sock.close()
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(('127.0.0.1', request.port))
+            try:
+                sock.send(('token=%s' % request.token[:4]).encode())
+                time.sleep(.2)
+                sock.send(('%s\ndata' % request.token[4:]).encode())
+            finally:
+                sock.close()
+            self.assertEqual(read(request), b'data')
+        self.assertEqual(self.receiver._unrouted, {})  # pylint: disable=protected-access
+
+    def test_timeout(self):
+        """Test that we time out when nobody connects"""
+        with self.receiver.request('addon.silent') as request:
+            with self.assertRaises(socket.timeout):
+                request.wait(.5)
+
+        # A next request can still receive a reply without a token
+        with self.receiver.request('addon.legacy') as request:
+            threading.Thread(target=send, args=(request.port, b'data')).start()
+            self.assertEqual(read(request), b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Tests for Sources"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from resources.lib.modules import sources
+
+try:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urljoin
+    from urllib.request import pathname2url
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib import pathname2url
+    from urlparse import urljoin
+
+PLAYLIST = '#EXTM3U\n#EXTINF:-1 tvg-id="één.be",één\nhttp://example.com/één.m3u8\n'.encode('utf-8')
+
+
+def gzipped(data):
+    fdesc = io.BytesIO()
+    with gzip.GzipFile(fileobj=fdesc, mode='wb') as gzfile:
+        gzfile.write(data)
+    return fdesc.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves a playlist with an ETag, and keeps track of the requests"""
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    ports = set()
+
+    def do_GET(self):
+        self.requests.append((self.path, dict(self.headers)))
+        self.ports.add(self.client_address[1])
+
+        if self.path == '/redirect':
+            self.reply(302, headers={'Location': '/playlist.m3u'})
+        elif self.path == '/playlist.m3u' and self.headers.get('If-None-Match') == '"v1"':
+            self.reply(304, headers={'ETag': '"v1"'})
+        elif self.path == '/playlist.m3u':
+            self.reply(200, gzipped(PLAYLIST), headers={'ETag': '"v1"', 'Content-Encoding': 'gzip'})
+        else:
+            self.reply(404)
+
+    def reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class SourcesTest(unittest.TestCase):
+    """Sources Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('localhost', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.base = 'http://localhost:%d/' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        sources.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        del Handler.requests[:]
+        Handler.ports.clear()
+
+    def test_http_conditional(self):
+        """Test that we decompress the data, and only download it again when it has changed"""
+        uri = urljoin(self.base, 'redirect')
+
+        with sources.fetch(uri) as payload:
+            self.assertEqual(payload.open().read(), PLAYLIST)
+
+        with sources.fetch(uri) as payload:
+            self.assertFalse(payload.changed)
+            self.assertEqual(payload.open().read(), PLAYLIST)
+
+        self.assertEqual([path for path, _ in Handler.requests], ['/redirect', '/playlist.m3u'] * 2)
+        self.assertEqual(Handler.requests[-1][1].get('If-None-Match'), '"v1"')
+
+        # All requests were sent over the same connection
+        self.assertEqual(len(Handler.ports), 1)
+
+    def test_http_path(self):
+        """Test that we download to the file of the caller, and give it back when the data didn't change"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'playlist.body')
+        uri = urljoin(self.base, 'playlist.m3u')
+        try:
+            for changed in (True, False):
+                with sources.fetch(uri, path) as payload:
+                    self.assertEqual(payload.changed, changed)
+                    self.assertEqual(payload.path, path)
+                    self.assertEqual(payload.open().read(), PLAYLIST)
+            self.assertEqual(os.listdir(directory), ['playlist.body'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_http_error(self):
+        """Test that an unexpected status raises an exception"""
+        with self.assertRaises(Exception):
+            sources.fetch(urljoin(self.base, 'missing'))
+
+    def test_file(self):
+        """Test that we detect if a local file has changed, and decompress gzipped files"""
+        fdesc, path = tempfile.mkstemp(suffix='.m3u.gz')
+        try:
+            with os.fdopen(fdesc, 'wb') as handle:
+                handle.write(gzipped(PLAYLIST))
+            uri = urljoin('file:', pathname2url(path))
+
+            with sources.fetch(uri) as payload:
+                self.assertTrue(payload.changed)
+                self.assertEqual(payload.open().read(), PLAYLIST)
+
+            with sources.fetch(uri) as payload:
+                self.assertFalse(payload.changed)
+                self.assertEqual(payload.open().read(), PLAYLIST)
+
+            with open(path, 'wb') as handle:
+                handle.write(PLAYLIST + PLAYLIST)
+
+            with sources.fetch(uri) as payload:
+                self.assertTrue(payload.changed)
+                self.assertEqual(payload.open().read(), PLAYLIST + PLAYLIST)
+
+            # We only remember the state of the file when we could store it for the caller
+            body_path = os.path.join(path + '.missing', 'body')
+            with self.assertRaises((IOError, OSError)):
+                sources.fetch(uri, body_path)
+            os.mkdir(os.path.dirname(body_path))
+            with sources.fetch(uri, body_path) as payload:
+                self.assertTrue(payload.changed)
+                self.assertEqual(payload.path, body_path)
+
+            # We give the copy of the caller back when the file didn't change
+            with sources.fetch(uri, body_path) as payload:
+                self.assertFalse(payload.changed)
+                self.assertEqual(payload.path, body_path)
+                self.assertEqual(payload.open().read(), PLAYLIST + PLAYLIST)
+            shutil.rmtree(os.path.dirname(body_path))
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests for the timestamp conversion"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+import dateutil.parser
+
+from resources.lib.modules.timestamps import from_xmltv, to_xmltv
+
+
+class TimestampsTest(unittest.TestCase):
+    """Timestamp conversion Tests"""
+
+    def test_same_as_dateutil(self):
+        """Test that we get exactly what we got with dateutil before"""
+        for value in ('2021-01-23T11:42:55+01:00', '2021-01-23T11:42:55-05:30', '2021-01-23T11:42:55+0100',
+                      '2021-01-23T11:42:55+01', '2021-01-23T11:42:55Z', '2021-01-23T11:42:55+00:00',
+                      '2021-01-23T11:42:55-00:00', '2021-01-23T11:42:55', '2021-01-23 11:42:55.123456+01:00',
+                      'Sat, 23 Jan 2021 11:42:55 +0100', '2021-01-23T11:42:55z'):
+            expected = dateutil.parser.parse(value).strftime('%Y%m%d%H%M%S %z').rstrip()
+            self.assertEqual(to_xmltv(value), expected)
+            self.assertEqual(to_xmltv(value), expected)
+
+    def test_invalid(self):
+        """Test that invalid timestamps still raise an exception"""
+        for value in ('2021-02-30T11:42:55+01:00', '2021-13-01T11:42:55Z', '2021-01-23T11:60:55', '2021-01-23T24:00:00',
+                      'tomorrow', None):
+            with self.assertRaises(Exception):
+                to_xmltv(value)
+
+    def test_epoch(self):
+        """Test that epoch timestamps are converted in UTC"""
+        self.assertEqual(to_xmltv(1611398575), '20210123104255 +0000')
+        self.assertEqual(to_xmltv(1611398575.5), '20210123104255 +0000')
+
+    def test_from_xmltv(self):
+        """Test that we can convert XMLTV timestamps back to epoch timestamps"""
+        self.assertEqual(from_xmltv('20210123104255 +0000'), 1611398575)
+        self.assertEqual(from_xmltv('20210123114255 +0100'), 1611398575)
+        self.assertEqual(from_xmltv('20210123051255 -0530'), 1611398575)
+        self.assertEqual(from_xmltv('20210123104255'), 1611398575)
+        self.assertEqual(from_xmltv('20210123114255+0100'), 1611398575)
+        with self.assertRaises(ValueError):
+            from_xmltv('202101231142')
+
+
+if __name__ == '__main__':
+    unittest.main()
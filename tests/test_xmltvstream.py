@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests for the incremental XMLTV reader"""
+
+# pylint: disable=invalid-name,missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import unittest
+
+from resources.lib.modules.addon import Addon, XmltvEpg
+from resources.lib.modules.guideindex import GuideIndex
+from resources.lib.modules.payload import Payload
+from resources.lib.modules.xmltv import ProgrammeSerializer
+from resources.lib.modules.xmltvstream import XmltvReader
+
+XMLTV = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE tv SYSTEM "xmltv.dtd">
+<tv generator-info-name="Example">
+<channel id="een&amp;twee.be">
+ <display-name>Eén &amp; twee</display-name>
+</channel>
+<channel id='channel2.com'/>
+<!-- <programme start="20210123110000 +0100" channel="comment"> -->
+<programme start="20210123114255 +0100" stop="20210123121255 +0100" channel="een&amp;twee.be">
+ <title>Ünïcödé</title>
+</programme>
+<programme start="20210123121255 +0100" stop="20210123124255 +0100" channel="channel2.com">
+ <title>Never closed</title>
+<programme start="20210123124255 +0100" stop="20210123131255 +0100" channel="channel2.com">
+ <title>Closed</title>
+</programme>
+<programme start="20210123131255 +0100" stop="20210123134255 +0100" channel="channel2.com" <title>Broken</title></programme>
+<programme start="20210123134255 +0100" stop="20210123141255 +0100" channel="channel2.com"><title>Last</title></programme>
+<programme start="20210123141255 +0100" stop="20210123144255 +0100" channel="channel2.com"><title>Truncated'''
+
+
+class XmltvStreamTest(unittest.TestCase):
+    """XMLTV reader Tests"""
+
+    def test_reader(self):
+        """Test that we read the channels and programmes, and skip the malformed ones, whatever the chunk size"""
+        for chunk_size in (1, 7, 64 * 1024):
+            reader = XmltvReader(io.BytesIO(XMLTV.encode('utf-8')), chunk_size=chunk_size)
+            elements = list(reader)
+            self.assertEqual([(tag, attributes.get('id') or attributes.get('start')[8:12]) for tag, attributes, _ in elements], [
+                ('channel', 'een&twee.be'),
+                ('channel', 'channel2.com'),
+                ('programme', '1142'),
+                ('programme', '1242'),
+                ('programme', '1342'),
+            ])
+            self.assertEqual(elements[1][2], "<channel id='channel2.com'/>")
+            self.assertEqual(elements[2][2], '<programme start="20210123114255 +0100" stop="20210123121255 +0100" '
+                                             'channel="een&amp;twee.be">\n <title>Ünïcödé</title>\n</programme>')
+            self.assertEqual(reader.skipped, 4)
+            self.assertEqual(reader.channel_ids(), ['een&twee.be', 'channel2.com'])
+
+    def test_max_element(self):
+        """Test that we don't buffer more than an element"""
+        data = '<tv><programme start="1">%s</programme><channel id="next"/></tv>' % ('x' * 1000)
+        reader = XmltvReader(io.BytesIO(data.encode('utf-8')), chunk_size=10, max_element=100)
+        self.assertEqual([attributes for _, attributes, _ in reader], [dict(id='next')])
+        self.assertEqual(reader.skipped, 1)
+
+    def test_passthrough(self):
+        """Test that we drop the channels and programmes that we already have, like we do for JSON-EPG"""
+        index = GuideIndex()
+        index.add_channel('EEN&twee.be')
+        index.add_programme('een&twee.be', 1611398575, 1611400375)
+        serializer = ProgrammeSerializer(index=index, channels={'een&twee.be', 'channel2.com'})
+
+        elements = XmltvReader(io.BytesIO(XMLTV.encode('utf-8')))
+        kept = [serializer.passthrough(tag, attributes, element) for tag, attributes, element in elements]
+        self.assertEqual([element[:30] if element else None for element in kept], [
+            None,
+            "<channel id='channel2.com'/>",
+            None,
+            '<programme start="202101231242',
+            '<programme start="202101231342',
+        ])
+        self.assertEqual(index.duplicate_channels, 1)
+        self.assertEqual(index.duplicate_programmes, 1)
+
+        serializer = ProgrammeSerializer(channels={'een&twee.be'}, until=1611400375)
+        kept = [serializer.passthrough(tag, attributes, element) for tag, attributes, element in elements]
+        self.assertEqual([element is not None for element in kept], [True, True, True, False, False])
+        self.assertEqual(serializer.dropped, 2)
+
+    def test_channel_ids(self):
+        """Test that we can still pass the XMLTV of an add-on through after we looked for its channels"""
+        payload = Payload()
+        payload.write('<tv><channel id="channel.example.com"/></tv>'.encode('utf-8'))
+        epg = XmltvEpg(Addon('plugin.video.example', None, None, None), payload, payload.open())
+        self.assertEqual(epg.channel_ids(), ['channel.example.com'])
+        self.assertEqual([element for _, _, element in epg], ['<channel id="channel.example.com"/>'])
+
+
+if __name__ == '__main__':
+    unittest.main()